@@ -24,6 +24,11 @@ def parse():
                         help='number of GPUs (0 indicates CPU)')
     parser.add_argument('--cudnn_benchmark', type=strtobool, default=True,
                         help='use CuDNN benchmark mode')
+    parser.add_argument('--cuda_warmup', type=strtobool, default=False,
+                        help='warm up the CUDA caching allocator with the longest mini-batch before training')
+    parser.add_argument('--train_dtype', type=str, default='float32',
+                        choices=['float32', 'O0', 'O1', 'O2', 'O3'],
+                        help='data type for training (O0-O3 are opt levels of apex mixed precision)')
     parser.add_argument('--model_save_dir', type=str, default=False,
                         help='directory to save a model')
     parser.add_argument('--resume', type=str, default=False, nargs='?',
@@ -452,6 +457,8 @@ def parse():
                         help='')
     parser.add_argument('--recog_n_average', type=int, default=1,
                         help='number of models for the model averaging of Transformer')
+    parser.add_argument('--recog_quantize', type=strtobool, default=False,
+                        help='quantize embedding and output layers of decoders to int8 for CPU decoding')
     parser.add_argument('--recog_streaming', type=strtobool, default=False,
                         help='streaming decoding')
     parser.add_argument('--recog_chunk_sync', type=strtobool, default=False,
@@ -18,6 +18,7 @@ import time
 
 from neural_sp.bin.args_asr import parse
 from neural_sp.bin.eval_utils import average_checkpoints
+from neural_sp.bin.eval_utils import quantize_decoder_layers
 from neural_sp.bin.train_utils import load_checkpoint
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import set_logger
@@ -103,6 +104,8 @@ def main():
                     load_checkpoint(model_e, recog_model_e)
                     if args.recog_n_gpus >= 1:
                         model_e.cuda()
+                    elif args.recog_quantize:
+                        model_e = quantize_decoder_layers(model_e)
                     ensemble_models += [model_e]
 
             # Load the LM for shallow fusion
@@ -171,10 +174,14 @@ def main():
             logger.info('ASR decoder state carry over: %s' % (args.recog_asr_state_carry_over))
             logger.info('LM state carry over: %s' % (args.recog_lm_state_carry_over))
             logger.info('model average (Transformer): %d' % (args.recog_n_average))
+            logger.info('int8 quantization: %s' % (args.recog_quantize))
 
             # GPU setting
             if args.recog_n_gpus >= 1:
                 model.cuda()
+            elif args.recog_quantize:
+                # int8 quantization is supported only on CPU
+                model = quantize_decoder_layers(model)
 
         start_time = time.time()
 
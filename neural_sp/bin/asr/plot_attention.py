@@ -149,7 +149,8 @@ def main():
                 exclude_eos=False,
                 refs_id=batch['ys'],
                 ensemble_models=ensemble_models[1:] if len(ensemble_models) > 1 else [],
-                speakers=batch['sessions'] if dataset.corpus == 'swbd' else batch['speakers'])
+                speakers=batch['sessions'] if dataset.corpus == 'swbd' else batch['speakers'],
+                return_aws=True)
 
             # Get CTC probs
             ctc_probs, topk_ids = None, None
@@ -16,6 +16,7 @@ import cProfile
 import logging
 import numpy as np
 import os
+import random
 from setproctitle import setproctitle
 import shutil
 import time
@@ -23,6 +24,7 @@ import torch
 from tqdm import tqdm
 
 from neural_sp.bin.args_asr import parse
+from neural_sp.bin.train_utils import load_amp_checkpoint
 from neural_sp.bin.train_utils import load_checkpoint
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import save_config
@@ -46,6 +48,11 @@ from neural_sp.trainers.optimizer import set_optimizer
 from neural_sp.trainers.reporter import Reporter
 from neural_sp.utils import mkdir_join
 
+try:
+    from apex import amp
+except ImportError:
+    amp = None
+
 torch.manual_seed(1)
 torch.cuda.manual_seed_all(1)
 
@@ -312,8 +319,20 @@ def main():
         load_checkpoint(teacher_lm, args.teacher_lm)
 
     # GPU setting
+    use_apex = args.train_dtype in ['O0', 'O1', 'O2', 'O3'] and args.n_gpus >= 1
     if args.n_gpus >= 1:
         model.cudnn_setting(deterministic=False, benchmark=args.cudnn_benchmark)
+        if use_apex:
+            assert amp is not None, 'apex is required for mixed precision training.'
+            assert args.convert_to_sgd_epoch > args.n_epochs, 'Optimizer conversion is not supported with apex.'
+            # NOTE: amp must be initialized before wrapping the model by DataParallel
+            # FP32 master weights are kept in the optimizer
+            model.cuda()
+            model, optimizer.optimizer = amp.initialize(model, optimizer.optimizer,
+                                                        opt_level=args.train_dtype)
+            if args.resume:
+                # NOTE: the loss scalers are created by amp.initialize, so restore them afterwards
+                load_amp_checkpoint(amp, args.resume)
         model = CustomDataParallel(model, device_ids=list(range(0, args.n_gpus)))
         model.cuda()
         if teacher is not None:
@@ -349,6 +368,32 @@ def main():
     else:
         tasks = ['all']
 
+    # Warm up the CUDA caching allocator with the longest mini-batch
+    # NOTE: this avoids allocation stalls and fragmentation when long utterances appear later
+    if args.n_gpus >= 1 and args.cuda_warmup:
+        df_indices_mb = train_set.df.sort_values(by=['xlen'], ascending=False).index[:args.batch_size * args.n_gpus]
+        batch_warmup = train_set.make_mini_batch(df_indices_mb)
+        # NOTE: the warmup must not change training, so restore random states
+        # (scheduled sampling, SpecAugment, dropout) and buffers (e.g., running stats of BN) afterwards
+        py_rng_state, np_rng_state = random.getstate(), np.random.get_state()
+        buffers = [(buf, buf.clone()) for buf in model.module.buffers()]
+        with torch.random.fork_rng(devices=list(range(0, args.n_gpus))):
+            for task in tasks:
+                loss, _ = model(batch_warmup, task, teacher=teacher, teacher_lm=teacher_lm)
+                if use_apex:
+                    # NOTE: do not update the loss scalers
+                    with amp.scale_loss(loss, optimizer.optimizer, delay_unscale=True) as scaled_loss:
+                        scaled_loss.backward()
+                else:
+                    loss.backward()
+                del loss
+        for buf, buf_init in buffers:
+            buf.data.copy_(buf_init)
+        random.setstate(py_rng_state)
+        np.random.set_state(np_rng_state)
+        optimizer.zero_grad()
+        del batch_warmup, buffers
+
     start_time_train = time.time()
     start_time_epoch = time.time()
     start_time_step = time.time()
@@ -370,12 +415,17 @@ def main():
             loss, observation = model(batch_train, task,
                                       teacher=teacher, teacher_lm=teacher_lm)
             reporter.add(observation)
-            loss.backward()
+            if use_apex:
+                with amp.scale_loss(loss, optimizer.optimizer) as scaled_loss:
+                    scaled_loss.backward()
+            else:
+                loss.backward()
             loss.detach()  # Trancate the graph
             if args.accum_grad_n_steps == 1 or accum_n_steps >= args.accum_grad_n_steps:
                 if args.clip_grad_norm > 0:
                     total_norm = torch.nn.utils.clip_grad_norm_(
-                        model.module.parameters(), args.clip_grad_norm)
+                        amp.master_params(optimizer.optimizer) if use_apex else model.module.parameters(),
+                        args.clip_grad_norm)
                     reporter.add_tensorboard_scalar('total_norm', total_norm)
                 optimizer.step()
                 optimizer.zero_grad()
@@ -439,7 +489,8 @@ def main():
                 reporter.epoch()  # plot
 
                 # Save the model
-                optimizer.save_checkpoint(model, save_path, remove_old=not transformer)
+                optimizer.save_checkpoint(model, save_path, remove_old=not transformer,
+                                          amp=amp if use_apex else None)
             else:
                 start_time_eval = time.time()
                 # dev
@@ -450,7 +501,8 @@ def main():
 
                 if optimizer.is_topk or transformer:
                     # Save the model
-                    optimizer.save_checkpoint(model, save_path, remove_old=not transformer)
+                    optimizer.save_checkpoint(model, save_path, remove_old=not transformer,
+                                              amp=amp if use_apex else None)
 
                     # test
                     if optimizer.is_topk:
@@ -55,3 +55,46 @@ def average_checkpoints(model, best_model_path, n_average, topk_list=[]):
     torch.save(checkpoint_avg, checkpoint_avg_path)
 
     return model
+
+
+def quantize_decoder_layers(model):
+    """Quantize the embedding and output projection layers of decoders to int8 for CPU decoding.
+
+    Weights of the output (and bottleneck) layers are quantized per output channel
+    and activations are quantized dynamically at every step. Embedding tables are
+    quantized per row (weight-only). Training is not affected.
+
+    Args:
+        model (nn.Module): ASR model
+    Returns:
+        model (nn.Module): ASR model whose decoder layers are quantized
+
+    """
+    if not hasattr(torch, 'quantization'):
+        logger.warning('int8 quantization requires PyTorch>=1.3. Skip quantization.')
+        return model
+
+    from torch.quantization import quantize_dynamic
+    try:
+        from torch.quantization import per_channel_dynamic_qconfig as qconfig
+    except ImportError:
+        from torch.quantization import default_dynamic_qconfig as qconfig
+
+    try:
+        from torch.quantization import float_qparams_weight_only_qconfig as qconfig_emb
+    except ImportError:
+        qconfig_emb = None  # quantized embedding requires PyTorch>=1.7
+
+    qconfig_spec = {}
+    for n, m in model.named_modules():
+        if not n.split('.')[0].startswith('dec_'):
+            continue
+        if n.split('.')[-1] in ['output', 'output_bn'] and isinstance(m, torch.nn.Linear):
+            qconfig_spec[n] = qconfig
+        elif n.split('.')[-1] == 'embed' and isinstance(m, torch.nn.Embedding) and qconfig_emb is not None:
+            qconfig_spec[n] = qconfig_emb
+    for n in qconfig_spec.keys():
+        logger.info('Quantize %s to int8' % n)
+    # NOTE: the quantized layers hold their own copies of weights,
+    # so tied embedding and output layers are quantized separately
+    return quantize_dynamic(model, qconfig_spec, dtype=torch.qint8, inplace=True)
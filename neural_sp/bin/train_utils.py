@@ -143,3 +143,18 @@ def load_checkpoint(model, checkpoint_path, optimizer=None):
     else:
         topk_list = []
     return topk_list
+
+
+def load_amp_checkpoint(amp, checkpoint_path):
+    """Load the state of apex amp (loss scalers) from a checkpoint.
+
+    Args:
+        amp: apex amp module already initialized by amp.initialize
+        checkpoint_path (str): path to the saved model (model..epoch-*)
+
+    """
+    checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+    if 'amp_state_dict' in checkpoint.keys():
+        amp.load_state_dict(checkpoint['amp_state_dict'])
+    else:
+        logger.warning('amp state is not found in %s.' % checkpoint_path)
@@ -79,7 +79,8 @@ def eval_word(models, dataset, recog_params, epoch,
                     refs_id=batch['ys'],
                     utt_ids=batch['utt_ids'],
                     speakers=batch['sessions' if dataset.corpus == 'swbd' else 'speakers'],
-                    ensemble_models=models[1:] if len(models) > 1 else [])
+                    ensemble_models=models[1:] if len(models) > 1 else [],
+                    return_aws=recog_params['recog_resolving_unk'])
 
             for b in range(len(batch['xs'])):
                 ref = batch['text'][b]
@@ -99,7 +100,8 @@ def eval_word(models, dataset, recog_params, epoch,
                         refs_id=batch['ys_sub1'],
                         utt_ids=batch['utt_ids'],
                         speakers=batch['sessions'] if dataset.corpus == 'swbd' else batch['speakers'],
-                        task='ys_sub1')
+                        task='ys_sub1',
+                        return_aws=True)
                     # TODO(hirofumi): support ys_sub2 and ys_sub3
 
                     assert not streaming
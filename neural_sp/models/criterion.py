@@ -41,18 +41,20 @@ def cross_entropy_lsm(logits, ys, lsm_prob, ignore_index, training, normalize_le
         if not normalize_length:
             loss *= (ys != ignore_index).sum() / bs
     else:
-        with torch.no_grad():
-            target_dist = logits.new_zeros(logits.size())
-            target_dist.fill_(lsm_prob / (vocab - 1))
-            mask = (ys == ignore_index)
-            ys_masked = ys.masked_fill(mask, 0)
-            target_dist.scatter_(1, ys_masked.unsqueeze(1), 1 - lsm_prob)
-
-        log_probs = torch.log_softmax(logits, dim=-1)
-        loss_sum = -torch.mul(target_dist, log_probs)
+        mask = (ys == ignore_index)
+        ys_masked = ys.masked_fill(mask, 0)
+
+        # NOTE: the smoothed target distribution is never materialized.
+        # sum_v q(v) * log p(v) = eps' * sum_v log p(v) + (1 - lsm_prob - eps') * log p(y),
+        # where eps' = lsm_prob / (vocab - 1) and sum_v log p(v) = sum_v logits(v) - vocab * lse
+        lse = torch.logsumexp(logits, dim=-1)
+        log_probs_y = logits.gather(1, ys_masked.unsqueeze(1)).squeeze(1) - lse
+        log_probs_sum = logits.sum(-1) - vocab * lse
+        eps = lsm_prob / (vocab - 1)
+        loss_sum = -(eps * log_probs_sum + (1 - lsm_prob - eps) * log_probs_y)
         n_tokens = len(ys) - mask.sum().item()
         denom = n_tokens if normalize_length else bs
-        loss = loss_sum.masked_fill(mask.unsqueeze(1), 0).sum() / denom
+        loss = loss_sum.masked_fill(mask, 0).sum() / denom
 
         ppl = np.exp(loss.item()) if normalize_length else np.exp(loss.item() * bs / n_tokens)
 
@@ -63,7 +63,8 @@ class LMBase(ModelBase):
         return loss, state, observation
 
     def _forward(self, ys, state, n_caches=0, predict_last=False):
-        ys = [np2tensor(y, self.device_id) for y in ys]  # <eos> is included
+        device_id = self.device_id
+        ys = [np2tensor(y, device_id) for y in ys]  # <eos> is included
         ys = pad_list(ys, self.pad)
         ys_in, ys_out = ys[:, :-1], ys[:, 1:]
 
@@ -13,6 +13,7 @@ from __future__ import print_function
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 NEG_INF = float(np.finfo(np.float32).min)
 
@@ -38,6 +39,9 @@ class AttentionMechanism(nn.Module):
 
     """
 
+    # NOTE: bumped when keys of triggered attention started to be projected by `w_key`
+    _version = 2
+
     def __init__(self, kdim, qdim, adim, atype,
                  sharpening_factor=1, sigmoid_smoothing=False,
                  conv_out_channels=10, conv_kernel_size=201, dropout=0.,
@@ -52,6 +56,7 @@ class AttentionMechanism(nn.Module):
         self.sigmoid_smoothing = sigmoid_smoothing
         self.n_heads = 1
         self.lookahead = lookahead
+        self.raw_key = False
         self.reset()
 
         # attention dropout applied after the softmax layer
@@ -100,6 +105,14 @@ class AttentionMechanism(nn.Module):
         self.key = None
         self.mask = None
 
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, *args, **kwargs):
+        # NOTE: triggered attention was misspelled in the key projection before version 2,
+        # so checkpoints saved before that fed raw keys and never trained `w_key`
+        version = local_metadata.get('version', None)
+        self.raw_key = self.atype == 'triggered_attention' and (version is None or version < 2)
+        super(AttentionMechanism, self)._load_from_state_dict(
+            state_dict, prefix, local_metadata, *args, **kwargs)
+
     def forward(self, key, value, query, mask=None, aw_prev=None,
                 mode='', cache=False, trigger_point=None):
         """Forward computation.
@@ -121,27 +134,35 @@ class AttentionMechanism(nn.Module):
 
         """
         bs, klen = key.size()[:2]
-        qlen = query.size(1)
+        n_rows = query.size(0)
 
         if aw_prev is None:
-            aw_prev = key.new_zeros(bs, 1, klen)
+            aw_prev = key.new_zeros(n_rows, 1, klen)
         else:
             aw_prev = aw_prev.squeeze(1)  # remove head dimension
 
         # Pre-computation of encoder-side features for computing scores
         if self.key is None or not cache:
-            if self.atype in ['add', 'trigerred_attention',
-                              'location', 'dot', 'luong_general']:
+            if self.raw_key:
+                self.key = key
+            elif self.atype in ['add', 'triggered_attention',
+                                'location', 'dot', 'luong_general']:
                 self.key = self.w_key(key)
+            elif self.atype == 'luong_concat':
+                # NOTE: project the key part of `w` once instead of concatenating it with query at every step
+                self.key = F.linear(key, self.w.weight[:, :key.size(-1)])
             else:
                 self.key = key
             self.mask = mask
             if mask is not None:
                 assert self.mask.size() == (bs, 1, klen), (self.mask.size(), (bs, 1, klen))
 
-        # for batch beam search decoding
-        if self.key.size(0) != query.size(0):
-            self.key = self.key[0:1, :, :].repeat([query.size(0), 1, 1])
+        # NOTE: for batch beam search decoding, hypotheses of each utterance are stacked
+        # in the batch dimension of query (`[B * n_hyps, 1, qdim]`). They are regarded as
+        # query positions so that the key, mask, and value of the utterance are broadcast
+        # to them instead of being repeated
+        query = query.view(bs, -1, query.size(-1))
+        qlen = query.size(1)
 
         if self.atype == 'no':
             raise NotImplementedError
@@ -150,24 +171,27 @@ class AttentionMechanism(nn.Module):
             # return cv, None
 
         elif self.atype in ['add', 'triggered_attention']:
+            # NOTE: apply tanh in-place to avoid another `[B, qlen, klen, adim]` buffer
             tmp = self.key.unsqueeze(1) + self.w_query(query).unsqueeze(2)
-            e = self.v(torch.tanh(tmp)).squeeze(3)
+            e = self.v(tmp.tanh_()).squeeze(3)
 
         elif self.atype == 'location':
-            conv_feat = self.conv(aw_prev.unsqueeze(1)).squeeze(2)  # `[B, ch, klen]`
-            conv_feat = conv_feat.transpose(2, 1).contiguous().unsqueeze(1)  # `[B, 1, klen, ch]`
+            # NOTE: run the `[1, kernel_size]` 2d convolution as a 1d convolution over time
+            conv_feat = F.conv1d(aw_prev, self.conv.weight.squeeze(2),
+                                 padding=self.conv.padding[1])  # `[B, ch, klen]`
+            conv_feat = self.w_conv(conv_feat.transpose(2, 1))  # `[B, klen, adim]`
             tmp = self.key.unsqueeze(1) + self.w_query(query).unsqueeze(2)
-            e = self.v(torch.tanh(tmp + self.w_conv(conv_feat))).squeeze(3)
+            e = self.v(tmp.add_(conv_feat.view(tmp.size())).tanh_()).squeeze(3)
 
         elif self.atype == 'dot':
-            e = torch.bmm(self.w_query(query), self.key.transpose(2, 1))
+            e = torch.matmul(self.w_query(query), self.key.transpose(2, 1))
 
         elif self.atype in ['luong_dot', 'luong_general']:
-            e = torch.bmm(query, self.key.transpose(2, 1))
+            e = torch.matmul(query, self.key.transpose(2, 1))
 
         elif self.atype == 'luong_concat':
-            query = query.repeat([1, klen, 1])
-            e = self.v(torch.tanh(self.w(torch.cat([self.key, query], dim=-1)))).transpose(2, 1)
+            query = F.linear(query, self.w.weight[:, -query.size(-1):])
+            e = self.v((self.key.unsqueeze(1) + query.unsqueeze(2)).tanh_()).squeeze(3)
         assert e.size() == (bs, qlen, klen), (e.size(), (bs, qlen, klen))
 
         # Mask the right part from the trigger point
@@ -180,10 +204,13 @@ class AttentionMechanism(nn.Module):
         if self.mask is not None:
             e = e.masked_fill_(self.mask == 0, NEG_INF)
         if self.sigmoid_smoothing:
-            aw = torch.sigmoid(e) / torch.sigmoid(e).sum(-1).unsqueeze(-1)
-        else:
+            aw = torch.sigmoid(e)
+            aw = aw / aw.sum(-1, keepdim=True)
+        elif self.sharpening_factor != 1:
             aw = torch.softmax(e * self.sharpening_factor, dim=-1)
+        else:
+            aw = torch.softmax(e, dim=-1)
         aw = self.dropout(aw)
         cv = torch.bmm(aw, value)
 
-        return cv, aw.unsqueeze(1), None
+        return cv.view(n_rows, -1, cv.size(-1)), aw.view(n_rows, 1, -1, klen), None
@@ -78,10 +78,8 @@ class GMMAttention(nn.Module):
         self.myu = myu  # register for the next step
 
         # Compute attention weights
-        js = torch.arange(klen).unsqueeze(0).unsqueeze(2).repeat([bs, 1, self.n_mix])
-        device_id = torch.cuda.device_of(next(self.parameters())).idx
-        if device_id >= 0:
-            js = js.cuda(device_id).float()
+        js = torch.arange(klen, dtype=myu.dtype, device=myu.device)
+        js = js.unsqueeze(0).unsqueeze(2)  # broadcast to `[B, klen, n_mix]`
         numerator = torch.exp(-torch.pow(js - myu, 2) / (2 * v + self.vfloor))
         denominator = torch.pow(2 * math.pi * v + self.vfloor, 0.5)
         aw = w * numerator / denominator  # `[B, klen, n_mix]`
@@ -132,6 +132,7 @@ class MonotonicEnergy(nn.Module):
                 assert self.mask.size() == (bs, self.n_heads, qlen, klen), \
                     (self.mask.size(), (bs, self.n_heads, qlen, klen))
 
+        # NOTE: hypotheses of each utterance in batch beam search decoding are regarded as query positions
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)
         query = query.transpose(2, 1).contiguous()  # `[B, H, qlen, d_k]`
 
@@ -139,7 +140,7 @@ class MonotonicEnergy(nn.Module):
             key = self.key.unsqueeze(2)  # `[B, H, 1, klen, d_k]`
             query = query.unsqueeze(3)  # `[B, H, qlen, 1, d_k]`
             e = torch.relu(key + query)  # `[B, H, qlen, klen, d_k]`
-            e = e.permute(0, 2, 3, 1, 4).contiguous().view(bs, qlen, klen, -1)
+            e = e.permute(0, 2, 3, 1, 4).contiguous().view(bs, -1, klen, self.n_heads * self.d_k)
             e = self.v(e).permute(0, 3, 1, 2)  # `[B, qlen, klen, H]`
         elif self.atype == 'scaled_dot':
             e = torch.matmul(query, self.key.transpose(3, 2)) / self.scale
@@ -148,7 +149,8 @@ class MonotonicEnergy(nn.Module):
             e = e + self.r
         if self.mask is not None:
             e = e.masked_fill_(self.mask == 0, NEG_INF)
-        assert e.size() == (bs, self.n_heads, qlen, klen), \
+        e = split_hyps(e, qlen)
+        assert e.size()[1:] == (self.n_heads, qlen, klen), \
             (e.size(), (bs, self.n_heads, qlen, klen))
         return e
 
@@ -230,9 +232,10 @@ class ChunkEnergy(nn.Module):
                 assert self.mask.size() == (bs, self.n_heads, qlen, klen), \
                     (self.mask.size(), (bs, self.n_heads, qlen, klen))
 
+        # NOTE: hypotheses of each utterance in batch beam search decoding are regarded as query positions
         if self.atype == 'add':
             key = self.key.unsqueeze(2)  # `[B, 1, 1, klen, d_k]`
-            query = self.w_query(query).unsqueeze(1).unsqueeze(3)  # `[B, 1, qlen, 1, d_k]`
+            query = self.w_query(query).view(bs, 1, -1, 1, self.d_k)  # `[B, 1, qlen, 1, d_k]`
             energy = torch.relu(key + query)  # `[B, 1, klen, qlen, d_k]`
             energy = self.v(energy).squeeze(4)  # `[B, 1, qlen, klen]`
         elif self.atype == 'scaled_dot':
@@ -242,7 +245,8 @@ class ChunkEnergy(nn.Module):
 
         if self.mask is not None:
             energy = energy.masked_fill_(self.mask == 0, NEG_INF)
-        assert energy.size() == (bs, self.n_heads, qlen, klen), \
+        energy = split_hyps(energy, qlen)
+        assert energy.size()[1:] == (self.n_heads, qlen, klen), \
             (energy.size(), (bs, self.n_heads, qlen, klen))
         return energy
 
@@ -323,6 +327,8 @@ class MoChA(nn.Module):
         self.dropout_head = dropout_head
         self.dropout_hard = dropout_hard
 
+        self.value = None
+
     def reset_parameters(self, bias):
         """Initialize parameters with Xavier uniform distribution."""
         logger.info('===== Initialize %s with Xavier uniform distribution =====' % self.__class__.__name__)
@@ -339,6 +345,7 @@ class MoChA(nn.Module):
         self.monotonic_energy.reset()
         if self.chunk_energy is not None:
             self.chunk_energy.reset()
+        self.value = None
 
     def forward(self, key, value, query, mask=None, aw_prev=None,
                 mode='hard', cache=False, trigger_point=None):
@@ -359,8 +366,8 @@ class MoChA(nn.Module):
             beta (FloatTensor): `[B, H_chunk, qlen, klen]`
 
         """
-        bs, klen = key.size()[:2]
-        qlen = query.size(1)
+        klen = key.size(1)
+        bs, qlen = query.size()[:2]
 
         if aw_prev is None:
             # aw_prev = [1, 0, 0 ... 0]
@@ -454,19 +461,23 @@ class MoChA(nn.Module):
 
         # Compute context vector
         if self.n_heads_mono * self.n_heads_chunk > 1:
-            value = self.w_value(value).view(bs, -1, self.n_heads_mono * self.n_heads_chunk, self.d_k)
-            value = value.transpose(2, 1).contiguous()  # `[B, H_mono * H_chunk, klen, d_k]`
+            # NOTE: project the value once per utterance as well as the key
+            if self.value is None or not cache:
+                value = self.w_value(value).view(value.size(0), -1, self.n_heads_mono * self.n_heads_chunk, self.d_k)
+                self.value = value.transpose(2, 1).contiguous()  # `[B, H_mono * H_chunk, klen, d_k]`
+            value = self.value
             if self.chunk_size == 1:
-                cv = torch.matmul(alpha, value)  # `[B, H_mono, qlen, d_k]`
+                cv = torch.matmul(merge_hyps(alpha, value.size(0)), value)  # `[B, H_mono, qlen, d_k]`
             else:
-                cv = torch.matmul(beta, value)  # `[B, H_mono * H_chunk, qlen, d_k]`
+                cv = torch.matmul(merge_hyps(beta, value.size(0)), value)  # `[B, H_mono * H_chunk, qlen, d_k]`
             cv = cv.transpose(2, 1).contiguous().view(bs, -1, self.n_heads_mono * self.n_heads_chunk * self.d_k)
             cv = self.w_out(cv)  # `[B, qlen, adim]`
         else:
             if self.chunk_size == 1:
-                cv = torch.bmm(alpha.squeeze(1), value)  # `[B, 1, adim]`
+                cv = torch.bmm(merge_hyps(alpha, value.size(0)).squeeze(1), value)  # `[B, 1, adim]`
             else:
-                cv = torch.bmm(beta.squeeze(1), value)  # `[B, 1, adim]`
+                cv = torch.bmm(merge_hyps(beta, value.size(0)).squeeze(1), value)  # `[B, 1, adim]`
+            cv = cv.view(bs, -1, cv.size(-1))
 
         assert alpha.size() == (bs, self.n_heads_mono, qlen, klen), \
             (alpha.size(), (bs, self.n_heads_mono, qlen, klen))
@@ -476,6 +487,36 @@ class MoChA(nn.Module):
         return cv, alpha, beta
 
 
+def split_hyps(x, qlen):
+    """Split query positions of each utterance into hypotheses for batch beam search decoding.
+
+    Args:
+        x (FloatTensor): `[B, H, n_hyps * qlen, klen]`
+        qlen (int): number of query positions per hypothesis
+    Return:
+        x (FloatTensor): `[B * n_hyps, H, qlen, klen]`
+
+    """
+    bs, n_heads, _, klen = x.size()
+    x = x.view(bs, n_heads, -1, qlen, klen).transpose(2, 1)
+    return x.contiguous().view(-1, n_heads, qlen, klen)
+
+
+def merge_hyps(x, bs):
+    """Merge hypotheses of each utterance into query positions for batch beam search decoding.
+
+    Args:
+        x (FloatTensor): `[B * n_hyps, H, qlen, klen]`
+        bs (int): number of utterances
+    Return:
+        x (FloatTensor): `[B, H, n_hyps * qlen, klen]`
+
+    """
+    _, n_heads, qlen, klen = x.size()
+    x = x.view(bs, -1, n_heads, qlen, klen).transpose(2, 1)
+    return x.contiguous().view(bs, n_heads, -1, klen)
+
+
 def add_gaussian_noise(xs, std):
     """Additive gaussian nosie to encourage discreteness."""
     noise = xs.new_zeros(xs.size()).normal_(std=std)
@@ -63,7 +63,7 @@ class MultiheadAttentionMechanism(nn.Module):
             self.w_key = nn.Linear(kdim, adim, bias=bias)
             self.w_value = nn.Linear(kdim, adim, bias=bias)
             self.w_query = nn.Linear(qdim, adim, bias=bias)
-            self.v = nn.Linear(adim, n_heads, bias=bias)
+            self.v = nn.Linear(self.d_k, 1, bias=bias)
         else:
             raise NotImplementedError(atype)
 
@@ -113,7 +113,7 @@ class MultiheadAttentionMechanism(nn.Module):
 
         """
         bs, klen = key.size()[: 2]
-        qlen = query.size(1)
+        n_rows, qlen = query.size()[:2]
 
         if self.key is None or not cache:
             self.key = self.w_key(key).view(bs, -1, self.n_heads, self.d_k)  # `[B, klen, H, d_k]`
@@ -124,12 +124,17 @@ class MultiheadAttentionMechanism(nn.Module):
                 assert self.mask.size() == (bs, qlen, klen, self.n_heads), \
                     (self.mask.size(), (bs, qlen, klen, self.n_heads))
 
+        # NOTE: for batch beam search decoding, hypotheses of each utterance are stacked
+        # in the batch dimension of query (`[B * n_hyps, 1, qdim]`). They are regarded as
+        # query positions so that the key, mask, and value of the utterance are broadcast
+        # to them instead of being repeated
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
+        key, value = self.key, self.value
 
         if self.atype == 'scaled_dot':
-            e = torch.einsum("bihd,bjhd->bijh", (query, self.key)) / self.scale  # `[B, qlen, klen, H]`
+            e = torch.einsum("bihd,bjhd->bijh", (query, key)) / self.scale  # `[B, qlen, klen, H]`
         elif self.atype == 'add':
-            key = self.key.unsqueeze(1)  # `[B, 1, klen, H, d_k]`
+            key = key.unsqueeze(1)  # `[B, 1, klen, H, d_k]`
             query = query.unsqueeze(2)  # `[B, qlen, 1, H, d_k]`
             e = self.v(torch.tanh(key + query)).squeeze(4)  # `[B, qlen, klen, H]`
 
@@ -138,9 +143,9 @@ class MultiheadAttentionMechanism(nn.Module):
             e = e.masked_fill_(self.mask == 0, NEG_INF)  # `[B, qlen, klen, H]`
         aw = torch.softmax(e, dim=2)
         aw = self.dropout(aw)
-        cv = torch.einsum("bijh,bjhd->bihd", (aw, self.value))  # `[B, qlen, H, d_k]`
+        cv = torch.einsum("bijh,bjhd->bihd", (aw, value))  # `[B, qlen, H, d_k]`
         cv = cv.contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
-        cv = self.w_out(cv)
-        aw = aw.permute(0, 3, 1, 2)  # `[B, H, qlen, klen]`
+        cv = self.w_out(cv).view(n_rows, qlen, -1)
+        aw = aw.contiguous().view(n_rows, qlen, klen, self.n_heads).permute(0, 3, 1, 2)  # `[B, H, qlen, klen]`
 
         return cv, aw, None
@@ -51,6 +51,26 @@ class BeamSearch(object):
             is_finish = True
         return new_hyps, end_hyps, is_finish
 
+    def backtrack(self, transcripts, transcript_ptrs, t, row):
+        """Recover a hypothesis from the trie by following back-pointers.
+
+        Args:
+            transcripts (np.ndarray): tokens at each step `[beam_width, ymax]`
+            transcript_ptrs (np.ndarray): row indices of parents at each step `[beam_width, ymax]`
+            t (int): step of the last token
+            row (int): row index of the last token at the step t
+        Returns:
+            hyp (list): token indices including <sos>
+            rows (list): row indices at each step
+
+        """
+        hyp, rows = [], []
+        for i in range(t, -1, -1):
+            hyp.append(int(transcripts[row, i]))
+            rows.append(row)
+            row = int(transcript_ptrs[row, i])
+        return hyp[::-1], rows[::-1]
+
     def add_ctc_score(self, hyp, topk_ids, ctc_state, total_scores_topk,
                       ctc_prefix_scorer, new_chunk=False, backward=False):
         beam_width = self.beam_width_bwd if backward else self.beam_width
@@ -63,11 +83,8 @@ class BeamSearch(object):
         if self.device_id >= 0:
             total_scores_ctc = total_scores_ctc.cuda(self.device_id)
         total_scores_topk += total_scores_ctc * self.ctc_weight
-        # Sort again
-        total_scores_topk, joint_ids_topk = torch.topk(
-            total_scores_topk, k=beam_width, dim=1, largest=True, sorted=True)
-        topk_ids = topk_ids[:, joint_ids_topk[0]]
-        new_ctc_states = new_ctc_states[joint_ids_topk[0].cpu().numpy()]
+        # NOTE: do not sort again here; scores and CTC states must stay aligned with
+        # `topk_ids`, and candidates are sorted by the caller after all scores are added
         return new_ctc_states, total_scores_ctc, total_scores_topk
 
     def add_lm_score(self):
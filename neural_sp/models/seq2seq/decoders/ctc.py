@@ -11,8 +11,9 @@ from __future__ import division
 from __future__ import print_function
 
 from collections import OrderedDict
-from itertools import groupby
+import heapq
 import logging
+import math
 import numpy as np
 import random
 import torch
@@ -121,7 +122,8 @@ class CTC(DecoderBase):
 
         trigger_points = None
         if forced_align:
-            ys = [np2tensor(np.fromiter(y, dtype=np.int64), self.device_id) for y in ys]
+            device_id = self.device_id
+            ys = [np2tensor(np.fromiter(y, dtype=np.int64), device_id) for y in ys]
             ys_in_pad = pad_list(ys, 0)  # pad by zero
             trigger_points = self.forced_aligner.align(logits.clone(), elens, ys_in_pad, ylens)
 
@@ -137,41 +139,21 @@ class CTC(DecoderBase):
             hyps (IntTensor): `[B, L]`
 
         """
-        bs, xmax, _ = eouts.size()
-        log_probs = torch.log_softmax(self.output(eouts), dim=-1)
-        best_paths = log_probs.argmax(-1)  # `[B, L]`
-
-        hyps = []
-        for b in range(bs):
-            indices = [best_paths[b, t].item() for t in range(elens[b])]
-
-            # Step 1. Collapse repeated labels
-            collapsed_indices = [x[0] for x in groupby(indices)]
-
-            # Step 2. Remove all blank labels
-            best_hyp = [x for x in filter(lambda x: x != self.blank, collapsed_indices)]
-            hyps.append(best_hyp)
-
-        ymax = max([len(h) for h in hyps])
+        bs = eouts.size(0)
+        # NOTE: argmax on the device and copy only the best paths to the host
+        best_paths = tensor2np(self.output(eouts).argmax(-1))  # `[B, T]`
+        is_emit = _emission_mask(best_paths, elens, self.blank)
 
         # pick up trigger points
-        trigger_points = log_probs.new_zeros((bs, ymax + 1), dtype=torch.int32)  # +1 for <eos>
+        # NOTE: select the most left trigger points
+        n_triggers = is_emit.sum(1)
+        trigger_points = np.zeros((bs, int(n_triggers.max()) + 1), dtype=np.int32)  # +1 for <eos>
         for b in range(bs):
-            n_triggers = 0
-            for t in range(elens[b]):
-                token_idx = best_paths[b, t]
+            trigger_points[b, :n_triggers[b]] = np.nonzero(is_emit[b])[0]
 
-                if token_idx == self.blank:
-                    continue
-                if not (t == 0 or token_idx != best_paths[b, t - 1]):
-                    continue
-
-                # NOTE: select the most left trigger points
-                trigger_points[b, n_triggers] = t
-                n_triggers += 1
-
-        return trigger_points
+        return np2tensor(trigger_points, self.device_id)
 
+    @torch.no_grad()
     def greedy(self, eouts, elens):
         """Greedy decoding.
 
@@ -182,22 +164,14 @@ class CTC(DecoderBase):
             hyps (np.ndarray): Best path hypothesis. `[B, L]`
 
         """
-        log_probs = torch.log_softmax(self.output(eouts), dim=-1)
-        best_paths = log_probs.argmax(-1)  # `[B, L]`
-
-        hyps = []
-        for b in range(eouts.size(0)):
-            indices = [best_paths[b, t].item() for t in range(elens[b])]
-
-            # Step 1. Collapse repeated labels
-            collapsed_indices = [x[0] for x in groupby(indices)]
-
-            # Step 2. Remove all blank labels
-            best_hyp = [x for x in filter(lambda x: x != self.blank, collapsed_indices)]
-            hyps.append(np.array(best_hyp))
+        # NOTE: argmax on the device and copy only the best paths to the host
+        best_paths = tensor2np(self.output(eouts).argmax(-1))  # `[B, T]`
+        is_emit = _emission_mask(best_paths, elens, self.blank)
+        hyps = [best_paths[b, is_emit[b]] for b in range(eouts.size(0))]
 
         return np.array(hyps)
 
+    @torch.no_grad()
     def beam_search(self, eouts, elens, params, idx2token,
                     lm=None, lm_second=None, lm_second_rev=None,
                     nbest=1, refs_id=None, utt_ids=None, speakers=None):
@@ -241,6 +215,11 @@ class CTC(DecoderBase):
 
         best_hyps = []
         log_probs = torch.log_softmax(self.output(eouts), dim=-1)
+        # NOTE: pick up the top-k scores of all frames by a single call and copy
+        # posteriors to the host at once instead of reading them per candidate
+        _, topk_ids = torch.topk(log_probs, k=min(beam_width, self.vocab), dim=-1, largest=True, sorted=True)
+        log_probs = tensor2np(log_probs)
+        topk_ids = tensor2np(topk_ids)
         for b in range(bs):
             # Elements in the beam are (prefix, (p_b, p_no_blank))
             # Initialize the beam with the empty sequence, a probability of
@@ -253,10 +232,7 @@ class CTC(DecoderBase):
 
             for t in range(elens[b]):
                 new_beam = []
-
-                # Pick up the top-k scores
-                log_probs_topk, topk_ids = torch.topk(
-                    log_probs[b:b + 1, t], k=min(beam_width, self.vocab), dim=-1, largest=True, sorted=True)
+                p_blank = float(log_probs[b, t, self.blank])
 
                 for i_beam in range(len(beam)):
                     hyp = beam[i_beam]['hyp'][:]
@@ -265,13 +241,12 @@ class CTC(DecoderBase):
                     score_lm = beam[i_beam]['score_lm']
 
                     # case 1. hyp is not extended
-                    new_p_b = np.logaddexp(p_b + log_probs[b, t, self.blank].item(),
-                                           p_nb + log_probs[b, t, self.blank].item())
+                    new_p_b = _logaddexp(p_b + p_blank, p_nb + p_blank)
                     if len(hyp) > 1:
-                        new_p_nb = p_nb + log_probs[b, t, hyp[-1]].item()
+                        new_p_nb = p_nb + float(log_probs[b, t, hyp[-1]])
                     else:
                         new_p_nb = LOG_0
-                    score_ctc = np.logaddexp(new_p_b, new_p_nb)
+                    score_ctc = _logaddexp(new_p_b, new_p_nb)
                     score_lp = len(hyp[1:]) * lp_weight
                     new_beam.append({'hyp': hyp,
                                      'score': score_ctc + score_lm + score_lp,
@@ -285,14 +260,14 @@ class CTC(DecoderBase):
                     # Update LM states for shallow fusion
                     if lm_weight > 0 and lm is not None:
                         _, lmstate, lm_log_probs = lm.predict(
-                            eouts.new_zeros(1, 1).fill_(hyp[-1]), beam[i_beam]['lmstate'])
+                            eouts.new_tensor([[hyp[-1]]], dtype=torch.int64), beam[i_beam]['lmstate'])
                     else:
                         lmstate = None
 
                     # case 2. hyp is extended
                     new_p_b = LOG_0
-                    for c in tensor2np(topk_ids)[0]:
-                        p_t = log_probs[b, t, c].item()
+                    for c in topk_ids[b, t]:
+                        p_t = float(log_probs[b, t, c])
 
                         if c == self.blank:
                             continue
@@ -302,13 +277,13 @@ class CTC(DecoderBase):
                             new_p_nb = p_b + p_t
                             # TODO(hirofumi): apply character LM here
                         else:
-                            new_p_nb = np.logaddexp(p_b + p_t, p_nb + p_t)
+                            new_p_nb = _logaddexp(p_b + p_t, p_nb + p_t)
                             # TODO(hirofumi): apply character LM here
                             if c == self.space:
                                 pass
                                 # TODO(hirofumi): apply word LM here
 
-                        score_ctc = np.logaddexp(new_p_b, new_p_nb)
+                        score_ctc = _logaddexp(new_p_b, new_p_nb)
                         score_lp = (len(hyp[1:]) + 1) * lp_weight
                         if lm_weight > 0 and lm is not None:
                             local_score_lm = lm_log_probs[0, 0, c].item() * lm_weight
@@ -323,16 +298,18 @@ class CTC(DecoderBase):
                                          'lmstate': lmstate})
 
                 # Pruning
-                beam = sorted(new_beam, key=lambda x: x['score'], reverse=True)[:beam_width]
+                # NOTE: partial selection instead of sorting all candidates
+                beam = heapq.nlargest(beam_width, new_beam, key=lambda x: x['score'])
 
             # Rescoing lattice
             if lm_second is not None:
+                device_id = self.device_id
                 new_beam = []
                 for i_beam in range(len(beam)):
-                    ys = [np2tensor(np.fromiter(beam[i_beam]['hyp'], dtype=np.int64), self.device_id)]
+                    ys = [np2tensor(np.fromiter(beam[i_beam]['hyp'], dtype=np.int64), device_id)]
                     ys_pad = pad_list(ys, lm_second.pad)
                     _, _, lm_log_probs = lm_second.predict(ys_pad, None)
-                    score_ctc = np.logaddexp(beam[i_beam]['p_b'], beam[i_beam]['p_nb'])
+                    score_ctc = _logaddexp(beam[i_beam]['p_b'], beam[i_beam]['p_nb'])
                     score_lm = lm_log_probs.sum() * lm_weight_second
                     score_lp = len(beam[i_beam]['hyp'][1:]) * lp_weight
                     new_beam.append({'hyp': beam[i_beam]['hyp'],
@@ -358,6 +335,43 @@ class CTC(DecoderBase):
         return np.array(best_hyps)
 
 
+def _logaddexp(x, y):
+    """Compute log(exp(x) + exp(y)) for Python scalars.
+
+    NOTE: np.logaddexp is a ufunc and much slower than the math module for scalars.
+
+    """
+    if x < y:
+        x, y = y, x
+    if y == float('-inf'):
+        return x
+    return x + math.log1p(math.exp(y - x))
+
+
+def _emission_mask(best_paths, elens, blank):
+    """Mark frames emitting labels in the best paths (collapse repeated labels and remove blanks).
+
+    Args:
+        best_paths (np.ndarray): `[B, T]`
+        elens (IntTensor or np.ndarray): `[B]`
+        blank (int): index for <blank>
+    Returns:
+        is_emit (np.ndarray): `[B, T]`
+
+    """
+    bs, xmax = best_paths.shape
+    if torch.is_tensor(elens):
+        elens = tensor2np(elens)
+    is_emit = np.ones((bs, xmax), dtype=np.bool_)
+    # Step 1. Collapse repeated labels
+    is_emit[:, 1:] = best_paths[:, 1:] != best_paths[:, :-1]
+    # Step 2. Remove all blank labels
+    is_emit &= best_paths != blank
+    # Exclude padded frames
+    is_emit &= np.arange(xmax)[None, :] < np.reshape(elens, (bs, 1))
+    return is_emit
+
+
 def _label_to_path(labels, blank):
     path = labels.new_zeros(labels.size(0), labels.size(1) * 2 + 1).fill_(blank).long()
     path[:, 1::2] = labels
@@ -18,6 +18,7 @@ import random
 import shutil
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from neural_sp.evaluators.edit_distance import compute_wer
 from neural_sp.models.criterion import cross_entropy_lsm
@@ -217,7 +218,7 @@ class RNNDecoder(DecoderBase):
                         enc_n_units, qdim, attn_dim,
                         n_heads=attn_n_heads,
                         dropout=dropout_att,
-                        attn_type='add')
+                        atype='add')
                 else:
                     self.score = AttentionMechanism(
                         enc_n_units, qdim, attn_dim, attn_type,
@@ -378,6 +379,8 @@ class RNNDecoder(DecoderBase):
             loss_mbr = 0.
             loss_ce = 0.
             bs = eouts.size(0)
+            device_id = self.device_id
+            eos = eouts.new_zeros(1).fill_(self.eos).long()
             for b in range(bs):
                 self.eval()
                 with torch.no_grad():
@@ -386,7 +389,7 @@ class RNNDecoder(DecoderBase):
                         eouts[b:b + 1], elens[b:b + 1], params=recog_params,
                         nbest=N_best, exclude_eos=True)
                     nbest_hyps_id_b = [np.fromiter(y, dtype=np.int64) for y in nbest_hyps_id[0]]
-                    scores_b = np2tensor(np.array(scores[0], dtype=np.float32), self.device_id)
+                    scores_b = np2tensor(np.array(scores[0], dtype=np.float32), device_id)
                     scores_b_norm = scores_b / scores_b.sum()
 
                     # 2. calculate expected WER
@@ -395,7 +398,7 @@ class RNNDecoder(DecoderBase):
                     wer_b = np2tensor(np.array([
                         compute_wer(ref=idx2token(ys[b]).split(' '),
                                     hyp=idx2token(nbest_hyps_id_b[n]).split(' '))[0] / 100
-                        for n in range(N_best)], dtype=np.float32), self.device_id)
+                        for n in range(N_best)], dtype=np.float32), device_id)
                     exp_wer_b = (scores_b_norm * wer_b).sum()
                     grad_b = (scores_b_norm * (wer_b - exp_wer_b)).sum()
 
@@ -407,8 +410,7 @@ class RNNDecoder(DecoderBase):
 
                 # 4. backward pass (attach gradient)
                 log_probs_b = torch.log_softmax(logits_b, dim=-1)
-                eos = eouts.new_zeros(1).fill_(self.eos).long()
-                nbest_hyps_id_b_eos = pad_list([torch.cat([np2tensor(np.fromiter(y, dtype=np.int64), self.device_id),
+                nbest_hyps_id_b_eos = pad_list([torch.cat([np2tensor(np.fromiter(y, dtype=np.int64), device_id),
                                                            eos], dim=0) for y in nbest_hyps_id[0]], self.pad)
                 loss_mbr += self.mbr(log_probs_b, nbest_hyps_id_b_eos, exp_wer_b, grad_b)
 
@@ -459,17 +461,21 @@ class RNNDecoder(DecoderBase):
         ys_emb = self.dropout_emb(self.embed(ys_in))
         src_mask = make_pad_mask(elens, self.device_id).unsqueeze(1)  # `[B, 1, T]`
         logits = []
-        for t in range(ys_in.size(1)):
-            is_sample = t > 0 and self._ss_prob > 0 and random.random() < self._ss_prob
+        ymax = ys_in.size(1)
+        # NOTE: draw scheduled sampling decisions for all steps before unrolling
+        is_samples = [t > 0 and random.random() < self._ss_prob for t in range(ymax)] \
+            if self._ss_prob > 0 else [False] * ymax
+        y_sample = None
+        for t in range(ymax):
+            is_sample = is_samples[t]
 
             # Update LM states for LM fusion
             if self.lm is not None:
-                y_lm = self.output(logits[-1]).detach().argmax(-1) if is_sample else ys_in[:, t:t + 1]
+                y_lm = y_sample if is_sample else ys_in[:, t:t + 1]
                 lmout, lmstate, _ = self.lm.predict(y_lm, lmstate)
 
             # Recurrency -> Score -> Generate
-            y_emb = self.dropout_emb(self.embed(
-                self.output(logits[-1]).detach().argmax(-1))) if is_sample else ys_emb[:, t:t + 1]
+            y_emb = self.dropout_emb(self.embed(y_sample)) if is_sample else ys_emb[:, t:t + 1]
             dstates, cv, aw, attn_v, beta = self.decode_step(
                 eouts, dstates, cv, y_emb, src_mask, aw, lmout, mode='parallel')
             aws.append(aw)  # `[B, H, 1, T]`
@@ -477,6 +483,11 @@ class RNNDecoder(DecoderBase):
                 betas.append(beta)  # `[B, H, 1, T]`
             logits.append(attn_v)
 
+            # Pick up 1-best only when it is fed back at the next step
+            if t < ymax - 1 and is_samples[t + 1]:
+                with torch.no_grad():
+                    y_sample = self.output(attn_v).argmax(-1)
+
         # for attention plot
         aws = torch.cat(aws, dim=2)  # `[B, H, L, T]`
         if not self.training:
@@ -519,62 +530,103 @@ class RNNDecoder(DecoderBase):
 
         # Initialization
         dstates = self.zero_state(bs)
-        if self.discourse_aware == 'state_carry_over' and self.dstate_prev is not None:
-            dstates['dstate']['hxs'], dstates['dstate']['cxs'] = self.dstate_prev
-            self.dstate_prev = None
+        carry_over = self.discourse_aware == 'state_carry_over'
+        if carry_over:
+            if self.dstate_prev is not None:
+                dstates['dstate'] = self.dstate_prev
+            self.dstate_prev = ([None] * bs, [None] * bs)
+            # Utterance indices in the mini-batch ending at each step (resolved once instead of per step)
+            last_steps = {}
+            for b, ylen in enumerate(ylens.tolist()):
+                last_steps.setdefault(ylen - 1, []).append(b)
         cv = eouts.new_zeros(bs, 1, self.enc_n_units)
         self.score.reset()
         aw, aws = None, []
         betas = []
         lmout, lmstate = None, None
 
-        ys_emb = self.dropout_emb(self.embed(ys_in))
+        # Embed all tokens at once and resolve per-step inputs before unrolling
+        ys_emb = self.dropout_emb(self.embed(ys_in)).split(1, dim=1)  # L * `[B, 1, emb_dim]`
+        trigger_points_t = None
+        if trigger_points is not None:
+            trigger_points_t = trigger_points[:, :ymax].unbind(1)  # L * `[B]`
+        use_ss = self._ss_prob > 0
+        # NOTE: draw scheduled sampling decisions for all steps before unrolling
+        is_samples = [t > 0 and random.random() < self._ss_prob for t in range(ymax)] \
+            if use_ss else [False] * ymax
+        # NOTE: attention weights are only needed for plotting and the MoChA losses
+        keep_aws = not self.training or self.attn_type == 'mocha' or self.quantity_loss_weight > 0
+
         src_mask = make_pad_mask(elens, self.device_id).unsqueeze(1)  # `[B, 1, T]`
         tgt_mask = (ys_out != self.pad).unsqueeze(2)  # `[B, L, 1]`
         logits = []
+        douts, cvs = [], []
+        y_sample = None
+
+        # Run the LM over all tokens at once under teacher-forcing for LM fusion
+        lmouts = None
+        if self.lm is not None and not use_ss:
+            self.lm.eval()
+            with torch.no_grad():
+                lmouts, _, _ = self.lm.predict(ys_in, None)  # `[B, L, lm_n_units]`
+
         for t in range(ymax):
-            is_sample = t > 0 and self._ss_prob > 0 and random.random() < self._ss_prob
+            is_sample = is_samples[t]
 
             # Update LM states for LM fusion
-            if self.lm is not None:
+            if lmouts is not None:
+                lmout = lmouts[:, t:t + 1]
+            elif self.lm is not None:
                 self.lm.eval()
                 with torch.no_grad():
-                    y_lm = self.output(logits[-1]).detach().argmax(-1) if is_sample else ys_in[:, t:t + 1]
+                    y_lm = y_sample if is_sample else ys_in[:, t:t + 1]
                     lmout, lmstate, _ = self.lm.predict(y_lm, lmstate)
 
             # Recurrency -> Score -> Generate
-            y_emb = self.dropout_emb(self.embed(
-                self.output(logits[-1]).detach().argmax(-1))) if is_sample else ys_emb[:, t:t + 1]
+            y_emb = self.dropout_emb(self.embed(y_sample)) if is_sample else ys_emb[t]
             dstates, cv, aw, attn_v, beta = self.decode_step(
                 eouts, dstates, cv, y_emb, src_mask, aw, lmout, mode='parallel',
-                trigger_point=trigger_points[:, t] if trigger_points is not None else None)
-            aws.append(aw)  # `[B, H, 1, T]`
-            if beta is not None:
-                betas.append(beta)  # `[B, H, 1, T]`
-            logits.append(attn_v)
-
-            if self.discourse_aware == 'state_carry_over':
-                if self.dstate_prev is None:
-                    self.dstate_prev = ([None] * bs, [None] * bs)
-                if t in ylens.tolist():
-                    for b in ylens.tolist().index(t):
-                        self.dstate_prev[0][b] = dstates['dstate']['hxs'][b:b + 1].detach()
-                        if self.dec_type == 'lstm':
-                            self.dstate_prev[1][b] = dstates['dstate']['cxs'][b:b + 1].detach()
-
-        if self.discourse_aware == 'state_carry_over':
-            self.dstate_prev[0] = torch.cat(self.dstate_prev[0], dim=1)
-            if self.dec_type == 'lstm':
-                self.dstate_prev[1] = torch.cat(self.dstate_prev[1], dim=1)
-
-        logits = self.output(torch.cat(logits, dim=1))
+                trigger_point=trigger_points_t[t] if trigger_points_t is not None else None,
+                generate=use_ss)
+            if keep_aws:
+                aws.append(aw)  # `[B, H, 1, T]`
+                if beta is not None:
+                    betas.append(beta)  # `[B, H, 1, T]`
+            if use_ss:
+                logits.append(attn_v)
+                # Pick up 1-best only when it is fed back at the next step
+                if t < ymax - 1 and is_samples[t + 1]:
+                    with torch.no_grad():
+                        y_sample = self.output(attn_v).argmax(-1)
+            else:
+                # NOTE: the output layers are applied to all steps at once after the loop
+                douts.append(dstates['dout_gen'])
+                cvs.append(cv)
+
+            if carry_over and t in last_steps:
+                for b in last_steps[t]:
+                    self.dstate_prev[0][b] = dstates['dstate'][0][:, b:b + 1].detach()
+                    if self.rnn_type == 'lstm':
+                        self.dstate_prev[1][b] = dstates['dstate'][1][:, b:b + 1].detach()
+
+        if carry_over:
+            self.dstate_prev = (torch.cat(self.dstate_prev[0], dim=1),
+                                torch.cat(self.dstate_prev[1], dim=1) if self.rnn_type == 'lstm' else None)
+
+        if use_ss:
+            logits = self.output(torch.cat(logits, dim=1))
+        else:
+            attn_v = self.generate(torch.cat(cvs, dim=1), torch.cat(douts, dim=1), lmouts)
+            logits = self.output(attn_v)
 
         # for knowledge distillation
         if return_logits:
             return logits
 
         # for attention plot
-        aws = torch.cat(aws, dim=2)  # `[B, H, L, T]`
+        if keep_aws:
+            aws = torch.cat(aws, dim=2)  # `[B, H, L, T]`
+            n_heads = aws.size(1)  # mono
         if not self.training:
             self.data_dict['elens'] = tensor2np(elens)
             self.data_dict['ylens'] = tensor2np(ylens)
@@ -584,8 +636,6 @@ class RNNDecoder(DecoderBase):
                 betas = torch.cat(betas, dim=2)  # `[B, H, L, T]`
                 self.aws_dict['xy_aws_beta'] = tensor2np(betas)
 
-        n_heads = aws.size(1)  # mono
-
         # Compute XE sequence loss (+ label smoothing)
         loss, ppl = cross_entropy_lsm(logits, ys_out, self.lsm_prob, self.pad, self.training)
 
@@ -607,10 +657,9 @@ class RNNDecoder(DecoderBase):
         # Latency loss
         loss_latency = 0.
         if trigger_points is not None and self.attn_type == 'mocha':
-            js = torch.arange(xtime).float().cuda(self.device_id)
-            js = js.repeat([bs, n_heads, ymax, 1])
+            js = torch.arange(xtime, dtype=aws.dtype, device=aws.device)  # broadcast to `[B, H_mono, L, T]`
             exp_trigger_points = (js * aws).sum(3)  # `[B, H_mono, L]`
-            trigger_points = trigger_points.float().cuda(self.device_id)  # `[B, L]`
+            trigger_points = trigger_points.to(aws)  # `[B, L]`
             trigger_points = trigger_points.unsqueeze(1)
             loss_latency = torch.abs(exp_trigger_points - trigger_points)  # `[B, H_mono, L]`
             # NOTE: trigger_points are padded with 0
@@ -627,11 +676,11 @@ class RNNDecoder(DecoderBase):
         return loss, acc, ppl, loss_quantity, loss_latency
 
     def decode_step(self, eouts, dstates, cv, y_emb, mask, aw, lmout,
-                    mode='hard', cache=True, trigger_point=None):
+                    mode='hard', cache=True, trigger_point=None, generate=True):
         dstates = self.recurrency(torch.cat([y_emb, cv], dim=-1), dstates['dstate'])
         cv, aw, beta = self.score(eouts, eouts, dstates['dout_score'], mask, aw,
                                   mode, cache, trigger_point)
-        attn_v = self.generate(cv, dstates['dout_gen'], lmout)
+        attn_v = self.generate(cv, dstates['dout_gen'], lmout) if generate else None
         return dstates, cv, aw, attn_v, beta
 
     def zero_state(self, bs):
@@ -676,23 +725,27 @@ class RNNDecoder(DecoderBase):
                        'dout_gen': None,  # for token generation
                        'dstate': None}
 
+        # NOTE: resolve submodules once instead of per layer
+        rnn, dropout = self.rnn, self.dropout
+        proj = self.proj if self.n_projs > 0 else None
+        is_lstm = self.rnn_type == 'lstm'
+
         new_hxs, new_cxs = [], []
         for l in range(self.n_layers):
-            if self.rnn_type == 'lstm':
-                h, c = self.rnn[l](dout, (hxs[l], cxs[l]))
+            if is_lstm:
+                h, c = rnn[l](dout, (hxs[l], cxs[l]))
                 new_cxs.append(c)
-            elif self.rnn_type == 'gru':
-                h = self.rnn[l](dout, hxs[l])
+            else:
+                h = rnn[l](dout, hxs[l])
             new_hxs.append(h)
-            dout = self.dropout(h)
-            if self.n_projs > 0:
-                dout = torch.tanh(self.proj[l](dout))
+            dout = dropout(h)
+            if proj is not None:
+                dout = proj[l](dout).tanh_()
             # use output in the first layer for attention scoring
             if l == 0:
                 new_dstates['dout_score'] = dout.unsqueeze(1)
         new_hxs = torch.stack(new_hxs, dim=0)
-        if self.rnn_type == 'lstm':
-            new_cxs = torch.stack(new_cxs, dim=0)
+        new_cxs = torch.stack(new_cxs, dim=0) if is_lstm else None
 
         # use oupput in the the last layer for label generation
         new_dstates['dout_gen'] = dout.unsqueeze(1)
@@ -725,9 +778,17 @@ class RNNDecoder(DecoderBase):
                 gated_lmout = gate * lmout
 
             out = self.output_bn(torch.cat([dec_feat, gated_lmout], dim=-1))
+        elif isinstance(self.output_bn, nn.Linear):
+            # NOTE: project the decoder output and the context vector by the corresponding
+            # slices of the weight and sum them instead of concatenating the inputs
+            w = self.output_bn.weight
+            out = F.linear(cv, w[:, dout.size(-1):], self.output_bn.bias)
+            out.add_(F.linear(dout, w[:, :dout.size(-1)]))
         else:
+            # e.g., quantized bottleneck layer
             out = self.output_bn(torch.cat([dout, cv], dim=-1))
-        attn_v = torch.tanh(out)
+        # NOTE: apply tanh in-place on the output of the bottleneck layer to avoid another buffer
+        attn_v = out.tanh_()
         return attn_v
 
     def _plot_attention(self, save_path, n_cols=1):
@@ -768,9 +829,10 @@ class RNNDecoder(DecoderBase):
             fig.savefig(os.path.join(_save_path, '%s.png' % k), dvi=500)
             plt.close()
 
+    @torch.no_grad()
     def greedy(self, eouts, elens, max_len_ratio, idx2token,
                exclude_eos=False, refs_id=None, utt_ids=None, speakers=None,
-               trigger_points=None):
+               trigger_points=None, return_aws=False):
         """Greedy decoding.
 
         Args:
@@ -783,9 +845,11 @@ class RNNDecoder(DecoderBase):
             utt_ids (list): utterance id list
             speakers (list): speaker list
             trigger_points (IntTensor): `[B, T]`
+            return_aws (bool): return attention weights
         Returns:
             hyps (list): A list of length `[B]`, which contains arrays of size `[L]`
-            aws (list): A list of length `[B]`, which contains arrays of size `[H, L, T]`
+            aws (list): A list of length `[B]`, which contains arrays of size `[H, L, T]`.
+                None if return_aws is False.
 
         """
         bs, xtime, _ = eouts.size()
@@ -804,35 +868,39 @@ class RNNDecoder(DecoderBase):
         if self.attn_type == 'triggered_attention':
             assert trigger_points is not None
 
-        hyps_batch, aws_batch = [], []
-        ylens = torch.zeros(bs).int()
-        eos_flags = [False] * bs
+        ylens = eouts.new_zeros(bs, dtype=torch.int32)
+        eos_flags = eouts.new_zeros(bs, dtype=torch.bool)
         ymax = int(math.floor(xtime * max_len_ratio)) + 1
+        # NOTE: preallocate output buffers and write each step into them
+        # instead of concatenating per-step outputs at the end
+        hyps_batch = eouts.new_zeros(bs, ymax, dtype=torch.int64)
+        aws_batch = None
         for t in range(ymax):
             # Update LM states for LM fusion
             if self.lm is not None:
-                lmout, lmstate = self.lm.decode(self.lm(y), lmstate)
+                lmout, lmstate, _ = self.lm.predict(y, lmstate)
 
             # Recurrency -> Score -> Generate
             y_emb = self.dropout_emb(self.embed(y))
             dstates, cv, aw, attn_v, _ = self.decode_step(
                 eouts, dstates, cv, y_emb, src_mask, aw, lmout,
                 trigger_point=trigger_points[:, t] if trigger_points is not None else None)
-            aws_batch += [aw]  # `[B, H, 1, T]`
+            if return_aws:
+                if aws_batch is None:
+                    aws_batch = eouts.new_zeros(bs, aw.size(1), ymax, xtime)
+                aws_batch[:, :, t:t + 1] = aw  # `[B, H, 1, T]`
 
             # Pick up 1-best
             y = self.output(attn_v).argmax(-1)
-            hyps_batch += [y]
+            hyps_batch[:, t:t + 1] = y
 
             # Count lengths of hypotheses
-            for b in range(bs):
-                if not eos_flags[b]:
-                    if y[b].item() == self.eos:
-                        eos_flags[b] = True
-                    ylens[b] += 1  # include <eos>
+            # NOTE: keep flags on the device and synchronize only once per step
+            ylens += (~eos_flags).int()  # include <eos>
+            eos_flags |= (y[:, 0] == self.eos)
 
             # Break if <eos> is outputed in all mini-batch
-            if sum(eos_flags) == bs:
+            if bool(eos_flags.all()):
                 break
             if t == ymax - 1:
                 break
@@ -840,18 +908,26 @@ class RNNDecoder(DecoderBase):
         # LM state carry over
         self.lmstate_final = lmstate
 
-        # Concatenate in L dimension
-        hyps_batch = tensor2np(torch.cat(hyps_batch, dim=1))
-        aws_batch = tensor2np(torch.cat(aws_batch, dim=2))  # `[B, H, L, T]`
+        # Truncate in L dimension
+        hyps_batch = tensor2np(hyps_batch[:, :t + 1])
+        ylens = tensor2np(ylens)
+        eos_flags = tensor2np(eos_flags)
 
         # Truncate by the first <eos> (<sos> in case of the backward decoder)
         if self.bwd:
             # Reverse the order
             hyps = [hyps_batch[b, :ylens[b]][::-1] for b in range(bs)]
-            aws = [aws_batch[b, :, :ylens[b]][::-1] for b in range(bs)]
         else:
             hyps = [hyps_batch[b, :ylens[b]] for b in range(bs)]
-            aws = [aws_batch[b, :, :ylens[b]] for b in range(bs)]
+
+        # NOTE: copy attention weights to the host only when requested
+        aws = None
+        if return_aws:
+            aws_batch = tensor2np(aws_batch[:, :, :t + 1])  # `[B, H, L, T]`
+            if self.bwd:
+                aws = [aws_batch[b, :, :ylens[b]][::-1] for b in range(bs)]
+            else:
+                aws = [aws_batch[b, :, :ylens[b]] for b in range(bs)]
 
         # Exclude <eos> (<sos> in case of the backward decoder)
         if exclude_eos:
@@ -872,11 +948,12 @@ class RNNDecoder(DecoderBase):
 
         return hyps, aws
 
+    @torch.no_grad()
     def beam_search(self, eouts, elens, params, idx2token=None,
                     lm=None, lm_second=None, lm_second_bwd=None, ctc_log_probs=None,
                     nbest=1, exclude_eos=False,
                     refs_id=None, utt_ids=None, speakers=None,
-                    ensmbl_eouts=None, ensmbl_elens=None, ensmbl_decs=[]):
+                    ensmbl_eouts=None, ensmbl_elens=None, ensmbl_decs=[], return_aws=False):
         """Beam search decoding.
 
         Args:
@@ -903,13 +980,15 @@ class RNNDecoder(DecoderBase):
             ensmbl_eouts (list): list of FloatTensor
             ensmbl_elens (list) list of list
             ensmbl_decs (list): list of torch.nn.Module
+            return_aws (bool): return attention weights of the best hypothesis
         Returns:
             nbest_hyps_idx (list): A list of length `[B]`, which contains list of N hypotheses
-            aws (list): A list of length `[B]`, which contains arrays of size `[H, L, T]`
+            aws (list): A list of length `[B]`, which contains arrays of size `[H, L, T]`.
+                None if return_aws is False.
             scores (list):
 
         """
-        bs, xmax, _ = eouts.size()
+        bs = eouts.size(0)
         n_models = len(ensmbl_decs) + 1
 
         beam_width = params['recog_beam_width']
@@ -930,6 +1009,28 @@ class RNNDecoder(DecoderBase):
         lm_state_CO = params['recog_lm_state_carry_over']
         softmax_smoothing = params['recog_softmax_smoothing']
 
+        if bs > 1 and speakers is not None and (asr_state_CO or lm_state_CO):
+            # NOTE: states are carried over from the previous utterance of the same speaker,
+            # so utterances are decoded one by one
+            nbest_hyps_idx, aws, scores = [], [], []
+            for b in range(bs):
+                nbest_hyps_idx_b, aws_b, scores_b = self.beam_search(
+                    eouts[b:b + 1, :elens[b]], elens[b:b + 1], params, idx2token,
+                    lm, lm_second, lm_second_bwd,
+                    ctc_log_probs[b:b + 1, :elens[b]] if ctc_log_probs is not None else None,
+                    nbest, exclude_eos,
+                    refs_id[b:b + 1] if refs_id is not None else None,
+                    utt_ids[b:b + 1] if utt_ids is not None else None,
+                    speakers[b:b + 1],
+                    [ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]] for i_e in range(n_models - 1)],
+                    [ensmbl_elens[i_e][b:b + 1] for i_e in range(n_models - 1)],
+                    ensmbl_decs, return_aws)
+                nbest_hyps_idx += nbest_hyps_idx_b
+                if return_aws:
+                    aws += aws_b
+                scores += scores_b
+            return nbest_hyps_idx, aws if return_aws else None, scores
+
         if lm is not None:
             assert lm_weight > 0
             lm.eval()
@@ -940,270 +1041,390 @@ class RNNDecoder(DecoderBase):
             assert lm_weight_second_bwd > 0
             lm_second_bwd.eval()
 
+        # NOTE: hypotheses of all utterances are decoded by a single decoder call per step.
+        # The k-th hypothesis of the b-th utterance is kept in the `b * beam_width + k`-th row,
+        # and rows without an active hypothesis are computed but never selected.
+        # Encoder outputs are not repeated per hypothesis, and the attention broadcasts
+        # the key and value of each utterance to its `beam_width` rows.
+        n_rows = bs * beam_width
+        src_mask = make_pad_mask(elens, self.device_id).unsqueeze(1)  # `[B, 1, T]`
+        ensmbl_src_mask = [make_pad_mask(ensmbl_elens[i_e], self.device_id).unsqueeze(1)
+                           for i_e in range(n_models - 1)]
+
+        # NOTE: copy encoder lengths to the host once instead of reading them per step
+        elens = tensor2np(elens)
+
+        # For joint CTC-Attention decoding
+        ctc_prefix_scorers = [None] * bs
         if ctc_log_probs is not None:
             assert ctc_weight > 0
             ctc_log_probs = tensor2np(ctc_log_probs)
-
-        nbest_hyps_idx, aws, scores = [], [], []
-        eos_flags = []
-        for b in range(bs):
-            # Initialization per utterance
-            self.score.reset()
-            dstates = self.zero_state(1)
-            lmstate = None
-
-            # For joint CTC-Attention decoding
-            ctc_prefix_scorer = None
-            if ctc_log_probs is not None:
+            for b in range(bs):
+                # NOTE: exclude padded frames in mini-batch decoding
                 if self.bwd:
-                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b][::-1], self.blank, self.eos)
+                    ctc_prefix_scorers[b] = CTCPrefixScore(ctc_log_probs[b, :elens[b]][::-1], self.blank, self.eos)
                 else:
-                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
+                    ctc_prefix_scorers[b] = CTCPrefixScore(ctc_log_probs[b, :elens[b]], self.blank, self.eos)
 
-            # Ensemble initialization
-            ensmbl_dstate, ensmbl_cv = [], []
-            if n_models > 1:
-                for dec in ensmbl_decs:
-                    ensmbl_dstate += [dec.zero_state(1)]
-                    ensmbl_cv += [eouts.new_zeros(1, 1, dec.enc_n_units)]
-                    dec.score.reset()
-
-            if speakers is not None:
-                if speakers[b] == self.prev_spk:
-                    if asr_state_CO:
-                        dstates = self.dstates_final
-                    if lm_state_CO and isinstance(lm, RNNLM):
-                        lmstate = self.lmstate_final
-                self.prev_spk = speakers[b]
-
-            helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id)
-
-            end_hyps = []
-            hyps = [{'hyp': [self.eos],
-                     'score': 0.,
-                     'score_att': 0.,
-                     'score_ctc': 0.,
-                     'score_lm': 0.,
-                     'dstates': dstates,
-                     'cv': eouts.new_zeros(1, 1, self.enc_n_units),
-                     'aws': [None],
-                     'lmstate': lmstate,
-                     'ensmbl_dstate': ensmbl_dstate,
-                     'ensmbl_cv': ensmbl_cv,
-                     'ensmbl_aws':[[None]] * (n_models - 1),
-                     'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None}]
-            ymax = int(math.floor(elens[b] * max_len_ratio)) + 1
-            for t in range(ymax):
-                # preprocess for batch decoding
-                y = eouts.new_zeros(len(hyps), 1).long()
-                for j, beam in enumerate(hyps):
-                    if self.replace_sos and t == 0:
-                        prev_idx = refs_id[0][0]
-                    else:
-                        prev_idx = beam['hyp'][-1]
-                    y[j, 0] = prev_idx
-                cv = torch.cat([beam['cv'] for beam in hyps], dim=0)
-                aw = torch.cat([beam['aws'][-1] for beam in hyps], dim=0) if t > 0 else None
-                hxs = torch.cat([beam['dstates']['dstate'][0] for beam in hyps], dim=1)
-                if self.rnn_type == 'lstm':
-                    cxs = torch.cat([beam['dstates']['dstate'][1] for beam in hyps], dim=1)
-                dstates = {'dstate': (hxs, cxs)}
-
-                # Update LM states for LM fusion
-                lmout, lmstate, scores_lm = None, None, None
-                if lm is not None or self.lm is not None:
-                    if hyps[0]['lmstate'] is not None:
-                        if isinstance(lm, RNNLM):
-                            lmstate = {'hxs': torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1),
-                                       'cxs': torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)}
-                    if self.lm is not None:
-                        # cold/deep fusion
-                        lmout, lmstate, scores_lm = self.lm.predict(y, lmstate)
-                    elif lm is not None:
-                        # shallow fusion
-                        lmout, lmstate, scores_lm = lm.predict(y, lmstate)
-
-                # for the main model
-                dstates, cv, aw, attn_v, _ = self.decode_step(
-                    eouts[b:b + 1, :elens[b]].repeat([cv.size(0), 1, 1]),
-                    dstates, cv, self.dropout_emb(self.embed(y)), None, aw, lmout)
-                probs = torch.softmax(self.output(attn_v).squeeze(1) * softmax_smoothing, dim=1)
-
-                # for the ensemble
-                ensmbl_dstate, ensmbl_cv, ensmbl_aws = [], [], []
-                if n_models > 1:
-                    for i_e, dec in enumerate(ensmbl_decs):
-                        cv_e = torch.cat([beam['ensmbl_cv'][i_e] for beam in hyps], dim=0)
-                        aw_e = torch.cat([beam['ensmbl_aws'][i_e][-1] for beam in hyps], dim=0) if t > 0 else None
-                        hxs_e = torch.cat([beam['ensmbl_dstate'][i_e]['dstate'][0] for beam in hyps], dim=1)
-                        if self.rnn_type == 'lstm':
-                            cxs_e = torch.cat([beam['dstates'][i_e]['dstate'][1] for beam in hyps], dim=1)
-                        dstates_e = {'dstate': (hxs_e, cxs_e)}
-
-                        dstate_e, cv_e, aw_e, attn_v_e, _ = dec.decode_step(
-                            ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]].repeat([cv_e.size(0), 1, 1]),
-                            dstates_e, cv_e, dec.dropout_emb(dec.embed(y)), None, aw_e, lmout)
-
-                        ensmbl_dstate += [{'dstate': (beam['dstates'][i_e]['dstate'][0][:, j:j + 1],
-                                                      beam['dstates'][i_e]['dstate'][1][:, j:j + 1])}]
-                        ensmbl_cv += [cv_e[j:j + 1]]
-                        ensmbl_aws += [beam['ensmbl_aws'][i_e] + [aw_e[j:j + 1]]]
-                        probs += torch.softmax(dec.output(attn_v_e).squeeze(1), dim=1)
-                        # NOTE: sum in the probability scale (not log-scale)
-
-                # Ensemble in log-scale
-                scores_att = torch.log(probs) / n_models
-
-                new_hyps = []
-                for j, beam in enumerate(hyps):
-                    # Attention scores
-                    total_scores_att = beam['score_att'] + scores_att[j:j + 1]
-                    total_scores = total_scores_att * (1 - ctc_weight)
-
-                    # Add LM score <after> top-K selection
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=1, largest=True, sorted=True)
-                    if lm is not None:
-                        total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
-                        total_scores_topk += total_scores_lm * lm_weight
-                    else:
-                        total_scores_lm = eouts.new_zeros(beam_width)
-
-                    # Add length penalty
-                    if lp_weight > 0:
-                        if gnmt_decoding:
-                            lp = math.pow(6 + len(beam['hyp'][1:]), lp_weight) / math.pow(6, lp_weight)
-                            total_scores_topk /= lp
-                        else:
-                            total_scores_topk += (len(beam['hyp'][1:]) + 1) * lp_weight
-
-                    # Add coverage penalty
-                    if cp_weight > 0:
-                        aw_mat = torch.cat(beam['aws'][1:] + [aw[j:j + 1]], dim=2)  # `[B, H, L, T]`
-                        aw_mat = aw_mat[:, 0, :, :]  # `[B, L, T]`
-                        if gnmt_decoding:
-                            aw_mat = torch.log(aw_mat.sum(-1))
-                            cp = torch.where(aw_mat < 0, aw_mat, aw_mat.new_zeros(aw_mat.size())).sum()
-                            # TODO(hirofumi): mask by elens[b]
-                            total_scores_topk += cp * cp_weight
-                        else:
-                            # Recompute converage penalty at each step
-                            if cp_threshold == 0:
-                                cp = aw_mat.sum() / self.score.n_heads
-                            else:
-                                cp = torch.where(aw_mat > cp_threshold, aw_mat,
-                                                 aw_mat.new_zeros(aw_mat.size())).sum() / self.score.n_heads
-                            total_scores_topk += cp * cp_weight
+        # NOTE: without length/coverage rewards, rescoring or ensembles, scores never
+        # increase along a path, so decoding can stop once no active hypothesis can
+        # overtake the N-best finished ones
+        early_stop = (lp_weight == 0 and cp_weight == 0 and not length_norm and
+                      n_models == 1 and lm_second is None and lm_second_bwd is None)
+
+        # Initialization
+        # NOTE: decoder/LM states of all hypotheses are kept as batched tensors
+        # (structure of arrays), and each hypothesis holds only its row index.
+        # The first step from <sos> has a single hypothesis per utterance, so it is
+        # computed on `B` rows and its outputs are expanded to all hypotheses afterwards.
+        self.score.reset()
+        dstates = self.zero_state(bs)
+        cv = eouts.new_zeros(bs, 1, self.enc_n_units)
+        aw, cp_sum = None, None
+        lmstate = None
+        lm_fusion = self.lm if self.lm is not None else lm
+
+        if speakers is not None:
+            # NOTE: states are carried over only when utterances are decoded one by one
+            if bs == 1 and speakers[0] == self.prev_spk:
+                if asr_state_CO:
+                    dstates = self.dstates_final
+                if lm_state_CO and isinstance(lm, RNNLM) and self.lmstate_final is not None:
+                    lmstate = self.lmstate_final
+            self.prev_spk = speakers[-1]
+
+        # Ensemble initialization
+        # NOTE: states of the ensemble are also kept as batched tensors per model
+        ensmbl_dstate, ensmbl_cv, ensmbl_aw = [], [], []
+        for dec in ensmbl_decs:
+            dec.score.reset()
+            ensmbl_dstate.append(dec.zero_state(bs))
+            ensmbl_cv.append(eouts.new_zeros(bs, 1, dec.enc_n_units))
+            ensmbl_aw.append(None)
+
+        helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id)
+
+        # NOTE: tokens are stored in a trie (a token and a back-pointer to the parent row
+        # per step) instead of copying the whole prefix for every candidate at every step.
+        # Hypotheses and attention weights are recovered by following the back-pointers.
+        ymax = [int(math.floor(elens[b] * max_len_ratio)) + 1 for b in range(bs)]
+        transcripts = [np.zeros((beam_width, ymax[b]), dtype=np.int64) for b in range(bs)]
+        transcript_ptrs = [np.zeros((beam_width, ymax[b]), dtype=np.int64) for b in range(bs)]
+        aws_steps = []
+
+        end_hyps = [[] for b in range(bs)]
+        hyps = [[{'token': self.eos,
+                  'step': -1,
+                  'score': 0.,
+                  'score_att': 0.,
+                  'score_cp': 0.,
+                  'score_ctc': 0.,
+                  'score_lm': 0.,
+                  'row': 0,
+                  'dstates': dstates,
+                  'lmstate': lmstate,
+                  'ctc_state': ctc_prefix_scorers[b].initial_state() if ctc_prefix_scorers[b] is not None else None}]
+                for b in range(bs)]
+        is_done = [False] * bs
+        for t in range(max(ymax)):
+            # NOTE: utterances finished early are kept in the batch until all utterances are finished
+            active = [b for b in range(bs) if not is_done[b]]
+            if len(active) == 0:
+                break
+
+            # Extend the trie by the last tokens of active hypotheses
+            for b in active:
+                transcripts[b][:len(hyps[b]), t] = [beam['token'] for beam in hyps[b]]
+                transcript_ptrs[b][:len(hyps[b]), t] = [beam['row'] for beam in hyps[b]]
+
+            # preprocess for batch decoding
+            # NOTE: copy previous tokens of all hypotheses to the device at once.
+            # Rows without an active hypothesis are fed <eos> and keep their own states.
+            prev_ids = [self.eos] * n_rows
+            rows = list(range(n_rows))
+            scores_att_prev = [0.] * n_rows
+            scores_lm_prev = [0.] * n_rows
+            for b in active:
+                for k, beam in enumerate(hyps[b]):
+                    i = b * beam_width + k
+                    prev_ids[i] = refs_id[b][0] if self.replace_sos and t == 0 else beam['token']
+                    rows[i] = b * beam_width + beam['row']
+                    scores_att_prev[i] = beam['score_att']
+                    scores_lm_prev[i] = beam['score_lm']
+            y = eouts.new_tensor(prev_ids[::beam_width] if t == 0 else prev_ids, dtype=torch.int64).unsqueeze(1)
+
+            # Gather states of surviving hypotheses from the previous step
+            if t > 0:
+                rows = eouts.new_tensor(rows, dtype=torch.int64)
+                hxs, cxs = dstates['dstate']
+                dstates = {'dstate': (hxs.index_select(1, rows),
+                                      cxs.index_select(1, rows) if cxs is not None else None)}
+                cv = cv.index_select(0, rows)
+                aw = aw.index_select(0, rows)
+                cp_sum = cp_sum.index_select(0, rows) if cp_sum is not None else None
+
+            # Update LM states for LM fusion (cold/deep fusion or shallow fusion)
+            lmout, scores_lm = None, None
+            if lm_fusion is not None:
+                if t > 0:
+                    if isinstance(lm_fusion, RNNLM):
+                        lmstate = {'hxs': lmstate['hxs'].index_select(1, rows),
+                                   'cxs': lmstate['cxs'].index_select(1, rows)
+                                   if lmstate['cxs'] is not None else None}
                     else:
-                        cp = 0.
-
-                    # Add CTC score
-                    new_ctc_states, total_scores_ctc, total_scores_topk = helper.add_ctc_score(
-                        beam['hyp'], topk_ids, beam['ctc_state'],
-                        total_scores_topk, ctc_prefix_scorer)
-
-                    for k in range(beam_width):
-                        idx = topk_ids[0, k].item()
-                        length_norm_factor = 1.
-                        if length_norm:
-                            length_norm_factor = len(beam['hyp'][1:]) + 1
-                        total_score = total_scores_topk[0, k].item() / length_norm_factor
-
-                        if idx == self.eos:
-                            # Exclude short hypotheses
-                            if len(beam['hyp']) - 1 < elens[b] * min_len_ratio:
-                                continue
-                            # EOS threshold
-                            max_score_no_eos = scores_att[j, :idx].max(0)[0].item()
-                            max_score_no_eos = max(max_score_no_eos, scores_att[j, idx + 1:].max(0)[0].item())
-                            if scores_att[j, idx].item() <= eos_threshold * max_score_no_eos:
-                                continue
-
-                        new_lmstate = None
-                        if lmstate is not None:
-                            if isinstance(lm, RNNLM):
-                                new_lmstate = {'hxs': lmstate['hxs'][:, j:j + 1],
-                                               'cxs': lmstate['cxs'][:, j:j + 1]}
-
-                        new_hyps.append(
-                            {'hyp': beam['hyp'] + [idx],
-                             'score': total_score,
-                             'score_att': total_scores_att[0, idx].item(),
-                             'score_cp': cp,
-                             'score_ctc': total_scores_ctc[k].item(),
-                             'score_lm': total_scores_lm[k].item(),
-                             'dstates': {'dstate': (dstates['dstate'][0][:, j:j + 1], dstates['dstate'][1][:, j:j + 1])},
-                             'cv': cv[j:j + 1],
-                             'aws': beam['aws'] + [aw[j:j + 1]],
-                             'lmstate': new_lmstate,
-                             'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None,
-                             'ensmbl_dstate': ensmbl_dstate,
-                             'ensmbl_cv': ensmbl_cv,
-                             'ensmbl_aws': ensmbl_aws})
+                        lmstate = None
+                lmout, lmstate, scores_lm = lm_fusion.predict(y, lmstate)
+
+            # for the main model
+            dstates, cv, aw, attn_v, _ = self.decode_step(
+                eouts, dstates, cv, self.dropout_emb(self.embed(y)), src_mask, aw, lmout)
+            scores_att = torch.log_softmax(self.output(attn_v).squeeze(1) * softmax_smoothing, dim=1)
+
+            # for the ensemble
+            ensmbl_scores_att = []
+            for i_e, dec in enumerate(ensmbl_decs):
+                # Gather states of surviving hypotheses from the previous step
+                if t > 0:
+                    hxs_e, cxs_e = ensmbl_dstate[i_e]['dstate']
+                    ensmbl_dstate[i_e] = {'dstate': (hxs_e.index_select(1, rows),
+                                                     cxs_e.index_select(1, rows) if cxs_e is not None else None)}
+                    ensmbl_cv[i_e] = ensmbl_cv[i_e].index_select(0, rows)
+                    ensmbl_aw[i_e] = ensmbl_aw[i_e].index_select(0, rows)
+
+                ensmbl_dstate[i_e], ensmbl_cv[i_e], ensmbl_aw[i_e], attn_v_e, _ = dec.decode_step(
+                    ensmbl_eouts[i_e], ensmbl_dstate[i_e], ensmbl_cv[i_e], dec.dropout_emb(dec.embed(y)),
+                    ensmbl_src_mask[i_e], ensmbl_aw[i_e], lmout)
+                ensmbl_scores_att += [torch.log_softmax(dec.output(attn_v_e).squeeze(1), dim=1)]
+
+            # Ensemble in log-scale
+            if n_models > 1:
+                # NOTE: sum in the probability scale (not log-scale) by logsumexp
+                # instead of taking log of the summed softmax outputs
+                scores_att = torch.logsumexp(torch.stack([scores_att] + ensmbl_scores_att, dim=0), dim=0) / n_models
+
+            # Expand outputs of the first step to all hypotheses
+            if t == 0:
+                rows = eouts.new_tensor([i // beam_width for i in range(n_rows)], dtype=torch.int64)
+                hxs, cxs = dstates['dstate']
+                dstates = {'dstate': (hxs.index_select(1, rows),
+                                      cxs.index_select(1, rows) if cxs is not None else None)}
+                cv = cv.index_select(0, rows)
+                aw = aw.index_select(0, rows)
+                scores_att = scores_att.index_select(0, rows)
+                if scores_lm is not None:
+                    scores_lm = scores_lm.index_select(0, rows)
+                if isinstance(lm_fusion, RNNLM):
+                    lmstate = {'hxs': lmstate['hxs'].index_select(1, rows),
+                               'cxs': lmstate['cxs'].index_select(1, rows) if lmstate['cxs'] is not None else None}
+                for i_e in range(n_models - 1):
+                    hxs_e, cxs_e = ensmbl_dstate[i_e]['dstate']
+                    ensmbl_dstate[i_e] = {'dstate': (hxs_e.index_select(1, rows),
+                                                     cxs_e.index_select(1, rows) if cxs_e is not None else None)}
+                    ensmbl_cv[i_e] = ensmbl_cv[i_e].index_select(0, rows)
+                    ensmbl_aw[i_e] = ensmbl_aw[i_e].index_select(0, rows)
+            if return_aws:
+                aws_steps.append(aw)
+
+            # Attention scores of all hypotheses at once
+            total_scores_att = eouts.new_tensor(scores_att_prev).unsqueeze(1) + scores_att
+            total_scores = total_scores_att * (1 - ctc_weight)
+
+            # Add LM score <after> top-K selection
+            # NOTE: select top-K candidates of all hypotheses by a single call
+            total_scores_topk_all, topk_ids_all = torch.topk(
+                total_scores, k=beam_width, dim=1, largest=True, sorted=True)
+            if lm is not None:
+                total_scores_lm_all = eouts.new_tensor(scores_lm_prev).unsqueeze(1) + \
+                    scores_lm[:, -1].gather(1, topk_ids_all)
+                total_scores_topk_all += total_scores_lm_all * lm_weight
+            else:
+                total_scores_lm_all = eouts.new_zeros(n_rows, beam_width)
+
+            # NOTE: all active hypotheses have the same length
+            hyp_len = t
+
+            # Add length penalty
+            if lp_weight > 0:
+                if gnmt_decoding:
+                    lp = math.pow(6 + hyp_len, lp_weight) / math.pow(6, lp_weight)
+                    total_scores_topk_all /= lp
+                else:
+                    total_scores_topk_all += (hyp_len + 1) * lp_weight
+
+            # Add coverage penalty
+            if cp_weight > 0:
+                # NOTE: each step adds a term that depends only on its own attention weights,
+                # so the penalty is accumulated per hypothesis instead of being recomputed
+                # from the concatenated attention history at every step
+                aw_t = aw[:, 0, 0]  # `[B, T]`
+                if gnmt_decoding:
+                    cp_t = torch.log(aw_t.sum(-1))
+                    cp_t = torch.where(cp_t < 0, cp_t, cp_t.new_zeros(cp_t.size()))
+                    # TODO(hirofumi): mask by elens[b]
+                else:
+                    if cp_threshold > 0:
+                        aw_t = torch.where(aw_t > cp_threshold, aw_t, aw_t.new_zeros(aw_t.size()))
+                    cp_t = aw_t.sum(-1) / self.score.n_heads
+                cp_sum = cp_t if cp_sum is None else cp_sum + cp_t
+                cp = cp_sum
+                total_scores_topk_all += cp.unsqueeze(1) * cp_weight
+                cp = tensor2np(cp)
+            else:
+                cp = np.zeros(n_rows, dtype=np.float32)
+
+            # Add CTC score
+            new_ctc_states, total_scores_ctc = [None] * n_rows, np.zeros((n_rows, beam_width))
+            if ctc_log_probs is not None:
+                for b in active:
+                    for j, beam in enumerate(hyps[b]):
+                        i = b * beam_width + j
+                        # NOTE: CTC prefix scoring is linear in the input length per hypothesis anyway
+                        hyp = helper.backtrack(transcripts[b], transcript_ptrs[b], t, j)[0]
+                        new_ctc_states[i], total_scores_ctc_i, total_scores_topk_i = helper.add_ctc_score(
+                            hyp, topk_ids_all[i:i + 1], beam['ctc_state'],
+                            total_scores_topk_all[i:i + 1], ctc_prefix_scorers[b])
+                        total_scores_ctc[i] = tensor2np(total_scores_ctc_i)
+                        total_scores_topk_all[i:i + 1] = total_scores_topk_i
+
+            # <eos> threshold
+            scores_att_no_eos = scores_att.clone()
+            scores_att_no_eos[:, self.eos] = float('-inf')
+            is_eos_ok = scores_att[:, self.eos] > eos_threshold * scores_att_no_eos.max(1)[0]
+
+            # NOTE: copy scores of all candidates to the host at once instead of
+            # synchronizing per candidate
+            total_scores_topk_all = tensor2np(total_scores_topk_all)
+            topk_ids_all_np = tensor2np(topk_ids_all)
+            total_scores_att_topk = tensor2np(total_scores_att.gather(1, topk_ids_all))
+            total_scores_lm_all = tensor2np(total_scores_lm_all)
+            is_eos_ok = tensor2np(is_eos_ok)
+
+            length_norm_factor = hyp_len + 1 if length_norm else 1.
+            total_scores_topk_all = total_scores_topk_all.astype(np.float64) / length_norm_factor
+
+            for b in active:
+                offset = b * beam_width
+                n_hyps = len(hyps[b])
+                total_scores_topk_b = total_scores_topk_all[offset:offset + n_hyps]
+
+                # Exclude short hypotheses and <eos> below the threshold
+                is_short = hyp_len < elens[b] * min_len_ratio
+                is_valid = topk_ids_all_np[offset:offset + n_hyps] != self.eos
+                if not is_short:
+                    is_valid |= is_eos_ok[offset:offset + n_hyps, None]
 
                 # Local pruning
-                new_hyps_sorted = sorted(new_hyps, key=lambda x: x['score'], reverse=True)[:beam_width]
+                # NOTE: select top-K candidates of all hypotheses by a single argsort
+                # instead of creating and sorting all candidates in Python
+                order = np.argsort(-total_scores_topk_b, axis=None, kind='stable')
+                order = order[is_valid.reshape(-1)[order]][:beam_width]
+                if len(order) == 0:
+                    # NOTE: no candidate is valid (e.g., only <eos> is proposed for a short hypothesis),
+                    # so keep the active hypotheses as the fallback for the final hypotheses
+                    is_done[b] = True
+                    continue
+
+                new_hyps_sorted = []
+                for jk in order:
+                    j, k = divmod(int(jk), beam_width)
+                    i = offset + j
+                    new_hyps_sorted.append(
+                        {'token': int(topk_ids_all_np[i, k]),
+                         'step': t,
+                         'score': float(total_scores_topk_all[i, k]),
+                         'score_att': float(total_scores_att_topk[i, k]),
+                         'score_cp': float(cp[i]),
+                         'score_ctc': float(total_scores_ctc[i, k]),
+                         'score_lm': float(total_scores_lm_all[i, k]),
+                         'row': j,
+                         'dstates': dstates,
+                         'lmstate': lmstate,
+                         'ctc_state': new_ctc_states[i][k] if ctc_prefix_scorers[b] is not None else None})
 
                 # Remove complete hypotheses
-                new_hyps, end_hyps, is_finish = helper.remove_complete_hyp(new_hyps_sorted, end_hyps)
-                hyps = new_hyps[:]
-                if is_finish:
-                    break
+                hyps[b] = [beam for beam in new_hyps_sorted if beam['token'] != self.eos]
+                end_hyps[b] += [beam for beam in new_hyps_sorted if beam['token'] == self.eos]
+                if len(end_hyps[b]) >= beam_width:
+                    end_hyps[b] = end_hyps[b][:beam_width]
+                    is_done[b] = True
+                elif len(hyps[b]) == 0 or t == ymax[b] - 1:
+                    is_done[b] = True
+
+                # Early stopping
+                elif early_stop and len(end_hyps[b]) >= nbest:
+                    worst_finished = sorted([beam['score'] for beam in end_hyps[b]], reverse=True)[nbest - 1]
+                    if max(beam['score'] for beam in hyps[b]) <= worst_finished:
+                        is_done[b] = True
 
+        nbest_hyps_idx, aws, scores = [], [], []
+        eos_flags = []
+        for b in range(bs):
             # Global pruning
-            if len(end_hyps) == 0:
-                end_hyps = hyps[:]
-            elif len(end_hyps) < nbest and nbest > 1:
-                end_hyps.extend(hyps[:nbest - len(end_hyps)])
+            if len(end_hyps[b]) == 0:
+                end_hyps[b] = hyps[b][:]
+            elif len(end_hyps[b]) < nbest and nbest > 1:
+                end_hyps[b].extend(hyps[b][:nbest - len(end_hyps[b])])
+
+            # Recover token sequences of final hypotheses from the trie
+            for beam in end_hyps[b]:
+                beam['hyp'] = helper.backtrack(transcripts[b], transcript_ptrs[b],
+                                               beam['step'], beam['row'])[0] + [beam['token']]
 
             # forward second path LM rescoring
             if lm_second is not None:
-                self.lm_rescoring(end_hyps, lm_second, lm_weight_second, tag='second')
+                self.lm_rescoring(end_hyps[b], lm_second, lm_weight_second, tag='second')
 
             # backward secodn path LM rescoring
             if lm_second_bwd is not None:
-                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd, tag='second_bwd')
+                self.lm_rescoring(end_hyps[b], lm_second_bwd, lm_weight_second_bwd, tag='second_bwd')
 
             # Sort by score
-            end_hyps = sorted(end_hyps, key=lambda x: x['score'], reverse=True)
+            end_hyps[b] = sorted(end_hyps[b], key=lambda x: x['score'], reverse=True)
 
             if utt_ids is not None:
                 logger.info('Utt-id: %s' % utt_ids[b])
             if idx2token is not None:
                 assert self.vocab == idx2token.vocab
                 logger.info('=' * 200)
-                for k in range(len(end_hyps)):
+                for k in range(len(end_hyps[b])):
                     if refs_id is not None:
                         logger.info('Ref: %s' % idx2token(refs_id[b]))
                     logger.info('Hyp: %s' % idx2token(
-                        end_hyps[k]['hyp'][1:][::-1] if self.bwd else end_hyps[k]['hyp'][1:]))
-                    logger.info('log prob (hyp): %.7f' % end_hyps[k]['score'])
-                    logger.info('log prob (hyp, att): %.7f' % (end_hyps[k]['score_att'] * (1 - ctc_weight)))
-                    logger.info('log prob (hyp, cp): %.7f' % (end_hyps[k]['score_cp'] * cp_weight))
-                    if ctc_prefix_scorer is not None:
-                        logger.info('log prob (hyp, ctc): %.7f' % (end_hyps[k]['score_ctc'] * ctc_weight))
+                        end_hyps[b][k]['hyp'][1:][::-1] if self.bwd else end_hyps[b][k]['hyp'][1:]))
+                    logger.info('log prob (hyp): %.7f' % end_hyps[b][k]['score'])
+                    logger.info('log prob (hyp, att): %.7f' % (end_hyps[b][k]['score_att'] * (1 - ctc_weight)))
+                    logger.info('log prob (hyp, cp): %.7f' % (end_hyps[b][k]['score_cp'] * cp_weight))
+                    if ctc_prefix_scorers[b] is not None:
+                        logger.info('log prob (hyp, ctc): %.7f' % (end_hyps[b][k]['score_ctc'] * ctc_weight))
                     if lm is not None:
-                        logger.info('log prob (hyp, first-path lm): %.7f' % (end_hyps[k]['score_lm'] * lm_weight))
+                        logger.info('log prob (hyp, first-path lm): %.7f' % (end_hyps[b][k]['score_lm'] * lm_weight))
                     if lm_second is not None:
                         logger.info('log prob (hyp, second-path lm): %.7f' %
-                                    (end_hyps[k]['score_lm_second'] * lm_weight_second))
+                                    (end_hyps[b][k]['score_lm_second'] * lm_weight_second))
                     if lm_second_bwd is not None:
                         logger.info('log prob (hyp, second-path lm, reverse): %.7f' %
-                                    (end_hyps[k]['score_lm_second_rev'] * lm_weight_second_bwd))
+                                    (end_hyps[b][k]['score_lm_second_rev'] * lm_weight_second_bwd))
                     logger.info('-' * 50)
 
             # N-best list
             if self.bwd:
                 # Reverse the order
-                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:][::-1]) for n in range(nbest)]]
-                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:][::-1], dim=2).squeeze(0))]
+                nbest_hyps_idx += [[np.array(end_hyps[b][n]['hyp'][1:][::-1]) for n in range(nbest)]]
             else:
-                nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:]) for n in range(nbest)]]
-                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:], dim=2).squeeze(0))]
-            scores += [[end_hyps[n]['score_att'] for n in range(nbest)]]
+                nbest_hyps_idx += [[np.array(end_hyps[b][n]['hyp'][1:]) for n in range(nbest)]]
+            if return_aws:
+                offset = b * beam_width
+                rows = helper.backtrack(transcripts[b], transcript_ptrs[b],
+                                        end_hyps[b][0]['step'], end_hyps[b][0]['row'])[1]
+                aws_best = [aws_steps[i][offset + row:offset + row + 1] for i, row in enumerate(rows)]
+                if self.bwd:
+                    aws_best = aws_best[::-1]
+                # NOTE: exclude padded frames in mini-batch decoding
+                aws += [tensor2np(torch.cat(aws_best, dim=2).squeeze(0)[:, :, :elens[b]])]
+            scores += [[end_hyps[b][n]['score_att'] for n in range(nbest)]]
 
             # Check <eos>
-            eos_flags.append([(end_hyps[n]['hyp'][-1] == self.eos) for n in range(nbest)])
+            eos_flags.append([(end_hyps[b][n]['hyp'][-1] == self.eos) for n in range(nbest)])
 
         # Exclude <eos> (<sos> in case of the backward decoder)
         if exclude_eos:
@@ -1214,12 +1435,21 @@ class RNNDecoder(DecoderBase):
                 nbest_hyps_idx = [[nbest_hyps_idx[b][n][:-1] if eos_flags[b][n]
                                    else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
 
-        # Store ASR/LM state
-        self.dstates_final = end_hyps[0]['dstates']
-        self.lmstate_final = end_hyps[0]['lmstate']
+        # Store ASR/LM state of the last utterance
+        best = end_hyps[-1][0]
+        hxs, cxs = best['dstates']['dstate']
+        # NOTE: states before the first step have a single row per utterance
+        row = (bs - 1) * (hxs.size(1) // bs) + best['row']
+        self.dstates_final = {'dstate': (hxs[:, row:row + 1], cxs[:, row:row + 1] if cxs is not None else None)}
+        self.lmstate_final = None
+        if best['lmstate'] is not None and isinstance(lm, RNNLM):
+            lmstate = best['lmstate']
+            self.lmstate_final = {'hxs': lmstate['hxs'][:, row:row + 1],
+                                  'cxs': lmstate['cxs'][:, row:row + 1] if lmstate['cxs'] is not None else None}
 
-        return nbest_hyps_idx, aws, scores
+        return nbest_hyps_idx, aws if return_aws else None, scores
 
+    @torch.no_grad()
     def beam_search_chunk_sync(self, eouts_c, params, idx2token,
                                lm=None, lm_second=None, ctc_log_probs=None,
                                hyps=False, state_carry_over=False, ignore_eos=False):
@@ -1311,9 +1541,7 @@ class RNNDecoder(DecoderBase):
             hyps = hyps_filtered[:]
 
             # preprocess for batch decoding
-            y = eouts_c.new_zeros(len(hyps), 1).long()
-            for j, beam in enumerate(hyps):
-                y[j, 0] = beam['hyp'][-1]
+            y = eouts_c.new_tensor([[beam['hyp'][-1]] for beam in hyps], dtype=torch.int64)
             cv = torch.cat([beam['cv'] for beam in hyps], dim=0)
             aw = torch.cat([beam['aws'][-1] for beam in hyps], dim=0) if t > 0 else None
             hxs = torch.cat([beam['dstates']['dstate'][0] for beam in hyps], dim=1)
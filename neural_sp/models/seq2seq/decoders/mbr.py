@@ -33,8 +33,7 @@ class MBR(torch.autograd.Function):
             loss (FloatTensor): `[1]`
 
         """
-        device_id = torch.cuda.device_of(log_probs).idx
-        onehot = torch.eye(log_probs.size(-1)).cuda(device_id)[hyps]
+        onehot = log_probs.new_zeros(log_probs.size()).scatter_(-1, hyps.unsqueeze(-1), 1)
         grads = grad * onehot  # mask out other classes
         # log_probs = log_probs.requires_grad_()
         ctx.save_for_backward(log_probs, grads)
@@ -224,7 +224,8 @@ class RNNTransducer(DecoderBase):
         """
         # Append <sos> and <eos>
         eos = eouts.new_zeros(1).fill_(self.eos).long()
-        _ys = [np2tensor(np.fromiter(y, dtype=np.int64), self.device_id) for y in ys]
+        device_id = self.device_id
+        _ys = [np2tensor(np.fromiter(y, dtype=np.int64), device_id) for y in ys]
         ylens = np2tensor(np.fromiter([y.size(0) for y in _ys], dtype=np.int32))
         ys_in = pad_list([torch.cat([eos, y], dim=0) for y in _ys], self.pad)
         ys_out = pad_list(_ys, self.blank)
@@ -327,8 +328,10 @@ class RNNTransducer(DecoderBase):
             zero_state['cxs'] = w.new_zeros(self.n_layers, batch_size, self.dec_n_units)
         return zero_state
 
+    @torch.no_grad()
     def greedy(self, eouts, elens, max_len_ratio, idx2token,
-               exclude_eos=False, refs_id=None, utt_ids=None, speakers=None):
+               exclude_eos=False, refs_id=None, utt_ids=None, speakers=None,
+               return_aws=False):
         """Greedy decoding.
 
         Args:
@@ -340,6 +343,7 @@ class RNNTransducer(DecoderBase):
             refs_id (list): reference list
             utt_ids (list): utterance id list
             speakers (list): speaker list
+            return_aws: dummy
         Returns:
             hyps (list): A list of length `[B]`, which contains arrays of size `[L]`
             aw: dummy
@@ -378,11 +382,12 @@ class RNNTransducer(DecoderBase):
 
         return hyps, None
 
+    @torch.no_grad()
     def beam_search(self, eouts, elens, params, idx2token,
                     lm=None, lm_second=None, lm_second_bwd=None, ctc_log_probs=None,
                     nbest=1, exclude_eos=False,
                     refs_id=None, utt_ids=None, speakers=None,
-                    ensmbl_eouts=None, ensmbl_elens=None, ensmbl_decs=[]):
+                    ensmbl_eouts=None, ensmbl_elens=None, ensmbl_decs=[], return_aws=False):
         """Beam search decoding.
 
         Args:
@@ -409,6 +414,7 @@ class RNNTransducer(DecoderBase):
             ensmbl_eouts (list): list of FloatTensor
             ensmbl_elens (list) list of list
             ensmbl_decs (list): list of torch.nn.Module
+            return_aws: dummy
         Returns:
             nbest_hyps_idx (list): A list of length `[B]`, which contains list of N hypotheses
             aws: dummy
@@ -439,11 +445,14 @@ class RNNTransducer(DecoderBase):
             assert ctc_weight > 0
             ctc_log_probs = tensor2np(ctc_log_probs)
 
+        # NOTE: copy encoder lengths to the host once instead of reading them per step
+        elens = tensor2np(elens)
+
         nbest_hyps_idx = []
         eos_flags = []
         for b in range(bs):
             # Initialization per utterance
-            y = eouts.new_zeros(bs, 1).fill_(self.eos).long()
+            y = eouts.new_zeros(1, 1).fill_(self.eos).long()
             y_emb = self.dropout_emb(self.embed(y))
             dout, dstate = self.recurrency(y_emb, None)
             lmstate = None
@@ -451,7 +460,8 @@ class RNNTransducer(DecoderBase):
             # For joint CTC-Attention decoding
             ctc_prefix_scorer = None
             if ctc_log_probs is not None:
-                ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
+                # NOTE: exclude padded frames in mini-batch decoding
+                ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b, :elens[b]], self.blank, self.eos)
 
             if speakers is not None:
                 if speakers[b] == self.prev_spk:
@@ -479,9 +489,7 @@ class RNNTransducer(DecoderBase):
                 scores_rnnt = torch.log_softmax(outs.squeeze(2).squeeze(1), dim=-1)
 
                 # Update LM states for shallow fusion
-                y = eouts.new_zeros(len(hyps), 1).long()
-                for j, beam in enumerate(hyps):
-                    y[j, 0] = beam['hyp'][-1]
+                y = eouts.new_tensor([[beam['hyp'][-1]] for beam in hyps], dtype=torch.int64)
                 lmstate, scores_lm = None, None
                 if lm is not None:
                     if hyps[0]['lmstate'] is not None:
@@ -396,8 +396,7 @@ class TransformerDecoder(DecoderBase):
         loss_headdiv = 0.
         if self.headdiv_loss_weight > 0.:
             # Calculate variance over all heads across all layers
-            js = torch.arange(xtime).float().cuda(self.device_id)
-            js = js.repeat([bs, n_heads, ytime, 1])
+            js = torch.arange(xtime, dtype=eouts.dtype, device=eouts.device)  # broadcast to `[B, H, L, T]`
             avg_head_pos = sum([(js * aws).sum(3).sum(1)
                                 for aws in xy_aws_layers]) / (n_heads * self.n_layers)  # `[B, L]`
             loss_headdiv = sum([((js * aws).sum(3).sum(1) - avg_head_pos) ** 2
@@ -409,12 +408,11 @@ class TransformerDecoder(DecoderBase):
         if trigger_points is not None and self.ctc_sync == 'minlt':
             assert self.minlt_loss_weight > 0
             # Calculate weight average latency
-            js = torch.arange(xtime).float().cuda(self.device_id)
-            js = js.repeat([bs, n_heads, ytime, 1])
+            js = torch.arange(xtime, dtype=eouts.dtype, device=eouts.device)  # broadcast to `[B, H, L, T]`
             weighted_avg_head_pos = torch.cat(
                 [(js * aws).sum(3) for aws in xy_aws_layers], dim=1)  # `[B, H_mono * n_layers, L]`
             weighted_avg_head_pos *= torch.softmax(weighted_avg_head_pos.clone(), dim=1)
-            trigger_points = trigger_points.float().cuda(self.device_id)  # `[B, L]`
+            trigger_points = trigger_points.to(eouts)  # `[B, L]`
             trigger_points = trigger_points.unsqueeze(1)
             loss_latency = torch.abs(weighted_avg_head_pos - trigger_points)  # `[B, H_mono * n_layers, L]`
             # NOTE: trigger_points are padded with 0
@@ -573,8 +571,10 @@ class TransformerDecoder(DecoderBase):
             fig.savefig(os.path.join(_save_path, '%s.png' % k), dvi=500)
             plt.close()
 
+    @torch.no_grad()
     def greedy(self, eouts, elens, max_len_ratio, idx2token,
-               exclude_eos=False, refs_id=None, utt_ids=None, speakers=None):
+               exclude_eos=False, refs_id=None, utt_ids=None, speakers=None,
+               return_aws=False):
         """Greedy decoding.
 
         Args:
@@ -586,9 +586,11 @@ class TransformerDecoder(DecoderBase):
             refs_id (list): reference list
             utt_ids (list): utterance id list
             speakers (list): speaker list
+            return_aws (bool): return attention weights
         Returns:
             hyps (list): A list of length `[B]`, which contains arrays of size `[L]`
-            aw (list): A list of length `[B]`, which contains arrays of size `[L, T]`
+            aw (list): A list of length `[B]`, which contains arrays of size `[L, T]`.
+                None if return_aws is False.
 
         """
         bs, xtime = eouts.size()[:2]
@@ -643,16 +645,22 @@ class TransformerDecoder(DecoderBase):
 
         # Concatenate in L dimension
         hyps_batch = tensor2np(torch.cat(hyps_batch, dim=1))
-        xy_aws = tensor2np(xy_aws.transpose(1, 2).transpose(2, 3))
 
         # Truncate by the first <eos> (<sos> in case of the backward decoder)
         if self.bwd:
             # Reverse the order
             hyps = [hyps_batch[b, :ylens[b]][::-1] for b in range(bs)]
-            aws = [xy_aws[b, :, :ylens[b]][::-1] for b in range(bs)]
         else:
             hyps = [hyps_batch[b, :ylens[b]] for b in range(bs)]
-            aws = [xy_aws[b, :, :ylens[b]] for b in range(bs)]
+
+        # NOTE: copy attention weights to the host only when requested
+        aws = None
+        if return_aws:
+            xy_aws = tensor2np(xy_aws.transpose(1, 2).transpose(2, 3))
+            if self.bwd:
+                aws = [xy_aws[b, :, :ylens[b]][::-1] for b in range(bs)]
+            else:
+                aws = [xy_aws[b, :, :ylens[b]] for b in range(bs)]
 
         # Exclude <eos> (<sos> in case of the backward decoder)
         if exclude_eos:
@@ -673,12 +681,13 @@ class TransformerDecoder(DecoderBase):
 
         return hyps, aws
 
+    @torch.no_grad()
     def beam_search(self, eouts, elens, params, idx2token=None,
                     lm=None, lm_second=None, lm_bwd=None, ctc_log_probs=None,
                     nbest=1, exclude_eos=False,
                     refs_id=None, utt_ids=None, speakers=None,
                     ensmbl_eouts=None, ensmbl_elens=None, ensmbl_decs=[],
-                    cache_states=True):
+                    cache_states=True, return_aws=False):
         """Beam search decoding.
 
         Args:
@@ -705,9 +714,11 @@ class TransformerDecoder(DecoderBase):
             ensmbl_eouts (list): list of FloatTensor
             ensmbl_elens (list) list of list
             ensmbl_decs (list): list of torch.nn.Module
+            return_aws (bool): return attention weights of the best hypothesis
         Returns:
             nbest_hyps_idx (list): A list of length `[B]`, which contains list of N hypotheses
-            aws (list): A list of length `[B]`, which contains arrays of size `[H, L, T]`
+            aws (list): A list of length `[B]`, which contains arrays of size `[H, L, T]`.
+                None if return_aws is False.
             scores (list):
 
         """
@@ -743,6 +754,9 @@ class TransformerDecoder(DecoderBase):
             assert ctc_weight > 0
             ctc_log_probs = tensor2np(ctc_log_probs)
 
+        # NOTE: copy encoder lengths to the host once instead of reading them per step
+        elens = tensor2np(elens)
+
         nbest_hyps_idx, aws, scores = [], [], []
         eos_flags = []
         for b in range(bs):
@@ -759,12 +773,13 @@ class TransformerDecoder(DecoderBase):
             ctc_prefix_scorer = None
             ctc_prefix_scorer_bwd = None
             if ctc_log_probs is not None:
+                # NOTE: exclude padded frames in mini-batch decoding
                 if self.bwd:
-                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b][::-1], self.blank, self.eos)
+                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b, :elens[b]][::-1], self.blank, self.eos)
                 else:
-                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
+                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b, :elens[b]], self.blank, self.eos)
                     if self.sync_bidir:
-                        ctc_prefix_scorer_bwd = CTCPrefixScore(ctc_log_probs[b][::-1], self.blank, self.eos)
+                        ctc_prefix_scorer_bwd = CTCPrefixScore(ctc_log_probs[b, :elens[b]][::-1], self.blank, self.eos)
 
             if speakers is not None:
                 if speakers[b] == self.prev_spk:
@@ -810,9 +825,7 @@ class TransformerDecoder(DecoderBase):
                 if cache_states and t > 0:
                     for l in range(self.n_layers):
                         cache[l] = torch.cat([beam['cache'][l] for beam in hyps_merge], dim=0)
-                ys = eouts.new_zeros(len(hyps_merge), t + 1).long()
-                for j, beam in enumerate(hyps_merge):
-                    ys[j, :] = beam['ys']
+                ys = torch.cat([beam['ys'] for beam in hyps_merge], dim=0)
                 if t > 0:
                     xy_aws_prev = torch.cat([beam['aws'][-1] for beam in hyps_merge], dim=0)
                     xy_aws_prev = xy_aws_prev.view(
@@ -826,9 +839,7 @@ class TransformerDecoder(DecoderBase):
                     if cache_states and t > 0:
                         for l in range(self.n_layers):
                             cache_bwd[l] = torch.cat([beam['cache_bwd'][l] for beam in hyps_merge], dim=0)
-                    ys_bwd = eouts.new_zeros(len(hyps_merge), t + 1).long()
-                    for j, beam in enumerate(hyps_merge):
-                        ys_bwd[j, :] = beam['ys_bwd']
+                    ys_bwd = torch.cat([beam['ys_bwd'] for beam in hyps_merge], dim=0)
 
                 # Update LM states for shallow fusion
                 lmstate, scores_lm = None, None
@@ -872,7 +883,7 @@ class TransformerDecoder(DecoderBase):
                         new_cache_bwd[l] = dout_bwd
                         xy_aws_all_layers.append(xy_aws)
                     logits_bwd = self.output(self.norm_out(dout_bwd))
-                    probs_bwd = torch.softmax(logits_bwd[:, -1] * softmax_smoothing, dim=1)
+                    scores_attn_bwd = torch.log_softmax(logits_bwd[:, -1] * softmax_smoothing, dim=1)
                 else:
                     for l, layer in enumerate(self.layers):
                         out, _, xy_aws, _, _ = layer(
@@ -883,13 +894,13 @@ class TransformerDecoder(DecoderBase):
                         if xy_aws is not None:
                             xy_aws_all_layers.append(xy_aws)
                 logits = self.output(self.norm_out(out))
-                probs = torch.softmax(logits[:, -1] * softmax_smoothing, dim=1)
+                scores_attn = torch.log_softmax(logits[:, -1] * softmax_smoothing, dim=1)
                 xy_aws_all_layers = torch.stack(xy_aws_all_layers, dim=2)  # `[B, H, n_layers, L, T]`
                 xy_aws_all_layers = xy_aws_all_layers.view(
                     xy_aws_all_layers.size(0), -1, xy_aws_all_layers.size(3), xmax)
 
                 # for the ensemble
-                ensmbl_new_cache = []
+                ensmbl_new_cache, ensmbl_scores_attn = [], []
                 if n_models > 1:
                     # Ensemble initialization
                     ensmbl_cache = []
@@ -907,13 +918,13 @@ class TransformerDecoder(DecoderBase):
                             new_cache_e[l] = out_e
                         ensmbl_new_cache.append(new_cache_e)
                         logits_e = dec.output(dec.norm_out(out_e))
-                        probs += torch.softmax(logits_e[:, -1] * softmax_smoothing, dim=1)
-                        # NOTE: sum in the probability scale (not log-scale)
+                        ensmbl_scores_attn += [torch.log_softmax(logits_e[:, -1] * softmax_smoothing, dim=1)]
 
                 # Ensemble in log-scale
-                scores_attn = torch.log(probs) / n_models
-                if self.sync_bidir:
-                    scores_attn_bwd = torch.log(probs_bwd)
+                if n_models > 1:
+                    # NOTE: sum in the probability scale (not log-scale) by logsumexp
+                    # instead of taking log of the summed softmax outputs
+                    scores_attn = torch.logsumexp(torch.stack([scores_attn] + ensmbl_scores_attn, dim=0), dim=0) / n_models
 
                 new_hyps, new_hyps_bwd = [], []
                 for j, beam in enumerate(hyps_merge):
@@ -1174,10 +1185,12 @@ class TransformerDecoder(DecoderBase):
             if self.bwd:
                 # Reverse the order
                 nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:][::-1]) for n in range(nbest)]]
-                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:][::-1], dim=2).squeeze(0))]
+                if return_aws:
+                    aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:][::-1], dim=2).squeeze(0))]
             else:
                 nbest_hyps_idx += [[np.array(end_hyps[n]['hyp'][1:]) for n in range(nbest)]]
-                aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:], dim=2).squeeze(0))]
+                if return_aws:
+                    aws += [tensor2np(torch.cat(end_hyps[0]['aws'][1:], dim=2).squeeze(0))]
             scores += [[end_hyps[n]['score_attn'] for n in range(nbest)]]
 
             # Check <eos>
@@ -1196,4 +1209,4 @@ class TransformerDecoder(DecoderBase):
         if len(end_hyps) > 0:
             self.lmstate_final = end_hyps[0]['lmstate']
 
-        return nbest_hyps_idx, aws, scores
+        return nbest_hyps_idx, aws if return_aws else None, scores
@@ -314,13 +314,19 @@ class RNNEncoder(EncoderBase):
                 if l != self.n_layers - 1:
                     # Projection layer -> Subsampling
                     if self.proj is not None:
-                        xs = torch.tanh(self.proj[l](xs))
+                        xs = self.proj[l](xs).tanh_()
                     if self.subsample_layer is not None:
                         xs, xlens = self.subsample_layer[l](xs, xlens)
 
         # Bridge layer
         if self.bridge is not None:
-            xs = self.bridge(xs)
+            if self.latency_controlled:
+                xs = self.bridge(xs)
+            else:
+                # NOTE: apply the bridge layer to valid frames only, skipping padding
+                xs_packed = pack_padded_sequence(xs, xlens.tolist(), batch_first=True)
+                xs_packed = xs_packed._replace(data=self.bridge(xs_packed.data))
+                xs = pad_packed_sequence(xs_packed, batch_first=True, total_length=xs.size(1))[0]
 
         # Unsort
         if not self.latency_controlled:
@@ -383,7 +389,7 @@ class RNNEncoder(EncoderBase):
                 if l != self.n_layers - 1:
                     # Projection layer -> Subsampling
                     if self.proj is not None:
-                        xs = torch.tanh(self.proj[l](xs))
+                        xs = self.proj[l](xs).tanh_()
                     if self.subsample_layer is not None:
                         xs, xlens = self.subsample_layer[l](xs, xlens)
 
@@ -419,7 +425,7 @@ class RNNEncoder(EncoderBase):
 
                 # Projection layer
                 if self.proj is not None and l != self.n_layers - 1:
-                    xs_chunk = torch.tanh(self.proj[l](xs_chunk))
+                    xs_chunk = self.proj[l](xs_chunk).tanh_()
             xs_chunks.append(xs_chunk[:, :N_l])
         xs = torch.cat(xs_chunks, dim=1)
 
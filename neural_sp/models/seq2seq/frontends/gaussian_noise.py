@@ -14,8 +14,6 @@ import torch
 
 
 def add_gaussian_noise(xs):
-    noise = torch.normal(torch.zeros(xs.shape[-1]), 0.075)
-    if xs.is_cuda:
-        noise = noise.cuda()
+    noise = xs.new_zeros(xs.shape[-1]).normal_(0, 0.075)
     xs.data += noise
     return xs
@@ -80,7 +80,7 @@ class SequenceSummaryNetwork(nn.Module):
         """
         bs, time = xs.size()[:2]
 
-        s = xs.clone()
+        s = xs
         for l in range(self.n_layers - 1):
             s = torch.tanh(self.ssn[l](s))
         s = self.ssn[self.n_layers - 1](s)  # `[B, T, input_dim]`
@@ -91,6 +91,6 @@ class SequenceSummaryNetwork(nn.Module):
         s = s.masked_fill_(mask == 0, 0)
 
         # time average
-        s = s.sum(1) / xlens.float().cuda(device_id).unsqueeze(1)
+        s = s.sum(1) / xlens.to(s).unsqueeze(1)
         xs = xs + self.p(s).unsqueeze(1)
         return xs
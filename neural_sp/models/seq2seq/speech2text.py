@@ -33,6 +33,7 @@ from neural_sp.models.seq2seq.frontends.splicing import splice
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import tensor2np
 from neural_sp.models.torch_utils import pad_list
+from neural_sp.models.torch_utils import pad_array
 
 random.seed(1)
 
@@ -252,20 +253,21 @@ class Speech2Text(ModelBase):
             eout_dict = self.encode(batch['ys_sub1'])
 
         observation = {}
-        loss = torch.zeros((1,), dtype=torch.float32)
-        if self.device_id >= 0:
-            loss = loss.cuda(self.device_id)
+        loss = next(self.parameters()).new_zeros((1,))
 
         # for the forward decoder in the main task
         if (self.fwd_weight > 0 or (self.bwd_weight == 0 and self.ctc_weight > 0) or self.mbr_training) and task in ['all', 'ys', 'ys.ctc', 'ys.mbr']:
             teacher_logits = None
+            # NOTE: teacher models are frozen, so do not build autograd graphs through them
             if teacher is not None:
                 teacher.eval()
-                teacher_logits = teacher.generate_logits(batch)
+                with torch.no_grad():
+                    teacher_logits = teacher.generate_logits(batch)
                 # TODO(hirofumi): label smoothing, scheduled sampling, dropout?
             elif teacher_lm is not None:
                 teacher_lm.eval()
-                teacher_logits = self.generate_lm_logits(batch['ys'], lm=teacher_lm)
+                with torch.no_grad():
+                    teacher_logits = self.generate_lm_logits(batch['ys'], lm=teacher_lm)
 
             loss_fwd, obs_fwd = self.dec_fwd(eout_dict['ys']['xs'], eout_dict['ys']['xlens'],
                                              batch['ys'], task, batch['ys_hist'],
@@ -332,7 +334,8 @@ class Speech2Text(ModelBase):
     def generate_lm_logits(self, ys, lm, temperature=5.0):
         # Append <sos> and <eos>
         eos = next(lm.parameters()).new_zeros(1).fill_(self.eos).long()
-        ys = [np2tensor(np.fromiter(y, dtype=np.int64), self.device_id)for y in ys]
+        device_id = self.device_id
+        ys = [np2tensor(np.fromiter(y, dtype=np.int64), device_id) for y in ys]
         ys_in = pad_list([torch.cat([eos, y], dim=0) for y in ys], self.pad)
         lmout, _ = lm.decode(ys_in, None)
         logits = lm.output(lmout)
@@ -360,7 +363,8 @@ class Speech2Text(ModelBase):
                 xs = [splice(x, self.n_splices, self.n_stacks) for x in xs]
             xlens = torch.IntTensor([len(x) for x in xs])
 
-            xs = pad_list([np2tensor(x, self.device_id).float() for x in xs], 0.)
+            # NOTE: pad on the host side and copy the whole mini-batch to the device at once
+            xs = np2tensor(pad_array(xs, 0.), self.device_id, pin_memory=True)
 
             # SpecAugment
             if self.use_specaug and self.training:
@@ -378,7 +382,8 @@ class Speech2Text(ModelBase):
 
         elif self.input_type == 'text':
             xlens = torch.IntTensor([len(x) for x in xs])
-            xs = [np2tensor(np.fromiter(x, dtype=np.int64), self.device_id) for x in xs]
+            device_id = self.device_id
+            xs = [np2tensor(np.fromiter(x, dtype=np.int64), device_id) for x in xs]
             xs = pad_list(xs, self.pad)
             xs = self.dropout_emb(self.embed(xs))
             # TODO(hirofumi): fix for Transformer
@@ -476,9 +481,10 @@ class Speech2Text(ModelBase):
                 # CTC-based VAD
                 ctc_log_probs_chunk = None
                 if ctc_vad:
-                    ctc_probs_chunk = self.dec_fwd.ctc_probs(eout_chunk)
+                    ctc_log_probs_all = self.dec_fwd.ctc_log_probs(eout_chunk)
+                    ctc_probs_chunk = torch.exp(ctc_log_probs_all)
                     if params['recog_ctc_weight'] > 0:
-                        ctc_log_probs_chunk = torch.log(ctc_probs_chunk)
+                        ctc_log_probs_chunk = ctc_log_probs_all
 
                     # Segmentation strategy 1:
                     # If any segmentation points are not found in the current chunk,
@@ -542,7 +548,7 @@ class Speech2Text(ModelBase):
                         elens = torch.IntTensor([eout.size(1)])
                         ctc_log_probs = None
                         if params['recog_ctc_weight'] > 0:
-                            ctc_log_probs = torch.log(self.dec_fwd.ctc_probs(eout))
+                            ctc_log_probs = self.dec_fwd.ctc_log_probs(eout)
                         nbest_hyps_id_offline, _, _ = self.dec_fwd.beam_search(
                             eout, elens, global_params, idx2token, lm, lm_second,
                             ctc_log_probs=ctc_log_probs)
@@ -615,7 +621,7 @@ class Speech2Text(ModelBase):
 
     def decode(self, xs, params, idx2token, exclude_eos=False,
                refs_id=None, refs=None, utt_ids=None, speakers=None,
-               task='ys', ensemble_models=[]):
+               task='ys', ensemble_models=[], return_aws=False):
         """Decoding in the inference stage.
 
         Args:
@@ -638,9 +644,11 @@ class Speech2Text(ModelBase):
             speakers (list):
             task (str): ys* or ys_sub1* or ys_sub2*
             ensemble_models (list): list of Speech2Text classes
+            return_aws (bool): return attention weights
         Returns:
             best_hyps_id (list): A list of length `[B]`, which contains arrays of size `[L]`
-            aws (list): A list of length `[B]`, which contains arrays of size `[L, T, n_heads]`
+            aws (list): A list of length `[B]`, which contains arrays of size `[L, T, n_heads]`.
+                None if return_aws is False.
 
         """
         if task.split('.')[0] == 'ys':
@@ -676,16 +684,17 @@ class Speech2Text(ModelBase):
                 best_hyps_id, aws = getattr(self, 'dec_' + dir).greedy(
                     eout_dict[task]['xs'], eout_dict[task]['xlens'],
                     params['recog_max_len_ratio'], idx2token,
-                    exclude_eos, refs_id, utt_ids, speakers)
+                    exclude_eos, refs_id, utt_ids, speakers, return_aws=return_aws)
             else:
-                assert params['recog_batch_size'] == 1
-
+                # NOTE: the encoder and CTC are run over the whole mini-batch at once.
+                # The RNN decoder also searches hypotheses of all utterances at once.
                 ctc_log_probs = None
                 if params['recog_ctc_weight'] > 0:
                     ctc_log_probs = self.dec_fwd.ctc_log_probs(eout_dict[task]['xs'])
 
                 # forward-backward decoding
                 if params['recog_fwd_bwd_attention']:
+                    assert params['recog_batch_size'] == 1
                     lm_fwd = getattr(self, 'lm_fwd', None)
                     lm_bwd = getattr(self, 'lm_bwd', None)
 
@@ -693,13 +702,15 @@ class Speech2Text(ModelBase):
                     nbest_hyps_id_fwd, aws_fwd, scores_fwd = self.dec_fwd.beam_search(
                         eout_dict[task]['xs'], eout_dict[task]['xlens'],
                         params, idx2token, lm_fwd, None, lm_bwd, ctc_log_probs,
-                        params['recog_beam_width'], False, refs_id, utt_ids, speakers)
+                        params['recog_beam_width'], False, refs_id, utt_ids, speakers,
+                        return_aws=True)
 
                     # backward decoder
                     nbest_hyps_id_bwd, aws_bwd, scores_bwd, _ = self.dec_bwd.beam_search(
                         eout_dict[task]['xs'], eout_dict[task]['xlens'],
                         params, idx2token, lm_bwd, None, lm_fwd, ctc_log_probs,
-                        params['recog_beam_width'], False, refs_id, utt_ids, speakers)
+                        params['recog_beam_width'], False, refs_id, utt_ids, speakers,
+                        return_aws=True)
 
                     # forward-backward attention
                     best_hyps_id = fwd_bwd_attention(
@@ -730,7 +741,7 @@ class Speech2Text(ModelBase):
                         eout_dict[task]['xs'], eout_dict[task]['xlens'],
                         params, idx2token, lm, lm_second, lm_bwd, ctc_log_probs,
                         1, exclude_eos, refs_id, utt_ids, speakers,
-                        ensmbl_eouts, ensmbl_elens, ensmbl_decs)
+                        ensmbl_eouts, ensmbl_elens, ensmbl_decs, return_aws=return_aws)
                     best_hyps_id = [hyp[0] for hyp in nbest_hyps_id]
 
             return best_hyps_id, aws
@@ -31,22 +31,45 @@ def tensor2np(x):
     return x.cpu().numpy()
 
 
-def np2tensor(array, device_id=-1):
+def np2tensor(array, device_id=-1, pin_memory=False):
     """Convert form np.ndarray to torch.Tensor.
 
     Args:
         array (np.ndarray): A tensor of any sizes
         device_id (int): ht index of the device
+        pin_memory (bool): copy to the device asynchronously via page-locked memory
     Returns:
         tensor (FloatTensor/IntTensor/LongTensor):
 
     """
     tensor = torch.from_numpy(array)
     if device_id >= 0:
-        tensor = tensor.cuda(device_id)
+        if pin_memory:
+            tensor = tensor.pin_memory().cuda(device_id, non_blocking=True)
+        else:
+            tensor = tensor.cuda(device_id)
     return tensor
 
 
+def pad_array(xs, pad_value=0., dtype=np.float32):
+    """Convert list of np.ndarray to a single np.ndarray with padding on the host side.
+
+    Args:
+        xs (list): A list of length `[B]`, which concains arrays of size `[T, input_size]`
+        pad_value (float):
+        dtype (np.dtype):
+    Returns:
+        xs_pad (np.ndarray): `[B, T, input_size]`
+
+    """
+    bs = len(xs)
+    max_time = max(len(x) for x in xs)
+    xs_pad = np.full((bs, max_time) + np.shape(xs[0])[1:], pad_value, dtype=dtype)
+    for b in range(bs):
+        xs_pad[b, :len(xs[b])] = xs[b]
+    return xs_pad
+
+
 def pad_list(xs, pad_value=0., pad_left=False):
     """Convert list of Tensors to a single Tensor with padding.
 
@@ -82,7 +105,7 @@ def make_pad_mask(seq_lens, device_id=-1):
 
     """
     bs = seq_lens.size(0)
-    max_time = max(seq_lens)
+    max_time = int(seq_lens.max())
 
     seq_range = torch.arange(0, max_time, dtype=torch.int32)
     seq_range_expand = seq_range.unsqueeze(0).expand(bs, max_time)
@@ -112,18 +135,18 @@ def append_sos_eos(xs, ys, sos, eos, pad, bwd=False, replace_sos=False):
 
     """
     device_id = torch.cuda.device_of(xs.data).idx
-    _eos = xs.new_zeros(1).fill_(eos).long()
-    ys = [np2tensor(np.fromiter(y[::-1] if bwd else y, dtype=np.int64),
-                    device_id) for y in ys]
+    ys = [np.fromiter(y[::-1] if bwd else y, dtype=np.int64) for y in ys]
+    # NOTE: <sos> and <eos> are attached on the host side to avoid creating
+    # token tensors and concatenating them on the device per utterance
     if replace_sos:
-        ylens = np2tensor(np.fromiter([y[1:].size(0) + 1 for y in ys], dtype=np.int32))  # +1 for <eos>
-        ys_in = pad_list([y for y in ys], pad)
-        ys_out = pad_list([torch.cat([y[1:], _eos], dim=0) for y in ys], pad)
+        ys_in = ys
+        ys_out = [np.append(y[1:], eos) for y in ys]
     else:
-        _sos = xs.new_zeros(1).fill_(sos).long()
-        ylens = np2tensor(np.fromiter([y.size(0) + 1 for y in ys], dtype=np.int32))  # +1 for <eos>
-        ys_in = pad_list([torch.cat([_sos, y], dim=0) for y in ys], pad)
-        ys_out = pad_list([torch.cat([y, _eos], dim=0) for y in ys], pad)
+        ys_in = [np.insert(y, 0, sos) for y in ys]
+        ys_out = [np.append(y, eos) for y in ys]
+    ylens = np2tensor(np.fromiter([len(y) for y in ys_out], dtype=np.int32))  # +1 for <eos>
+    ys_in = np2tensor(pad_array(ys_in, pad, dtype=np.int64), device_id)
+    ys_out = np2tensor(pad_array(ys_out, pad, dtype=np.int64), device_id)
     return ys_in, ys_out, ylens
 
 
@@ -177,7 +177,7 @@ class LRScheduler(object):
             else:
                 param_group['lr'] = self.lr
 
-    def save_checkpoint(self, model, save_path, remove_old=True):
+    def save_checkpoint(self, model, save_path, remove_old=True, amp=None):
         """Save checkpoint.
 
         Args:
@@ -186,6 +186,7 @@ class LRScheduler(object):
             optimizer (LRScheduler): optimizer wrapped by LRScheduler class
             remove_old (bool): if True, all checkpoints
                 worse than the top-k ones are deleted
+            amp: apex amp module for mixed precision training
 
         """
         model_path = os.path.join(save_path, 'model.epoch-' + str(self.n_epochs))
@@ -204,6 +205,8 @@ class LRScheduler(object):
             "model_state_dict": model.module.state_dict(),
             "optimizer_state_dict": self.state_dict(),  # LRScheduler class
         }
+        if amp is not None:
+            checkpoint["amp_state_dict"] = amp.state_dict()  # loss scalers
         torch.save(checkpoint, model_path)
 
         logger.info("=> Saved checkpoint (epoch:%d): %s" % (self.n_epochs, model_path))
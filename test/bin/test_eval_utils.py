@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for utility functions for evaluation."""
+
+import copy
+import pytest
+import torch
+import torch.nn as nn
+
+from neural_sp.bin.eval_utils import quantize_decoder_layers
+from neural_sp.models.seq2seq.decoders.las import RNNDecoder
+
+pytestmark = pytest.mark.skipif(not hasattr(torch, 'quantization'),
+                                reason='int8 quantization requires PyTorch>=1.3')
+
+PAD = 3
+
+
+class ASR(nn.Module):
+    def __init__(self, tie_embedding):
+        super(ASR, self).__init__()
+        torch.manual_seed(0)
+        self.dec_fwd = RNNDecoder(
+            special_symbols={'eos': 2, 'unk': 1, 'pad': PAD, 'blank': 0},
+            enc_n_units=16, attn_type='location', rnn_type='lstm', n_units=16, n_projs=0,
+            n_layers=1, bottleneck_dim=16, emb_dim=16, vocab=12, tie_embedding=tie_embedding,
+            attn_dim=16, attn_sharpening_factor=1., attn_sigmoid_smoothing=False,
+            attn_conv_out_channels=4, attn_conv_kernel_size=5, attn_n_heads=1,
+            dropout=0., dropout_emb=0., dropout_att=0.,
+            lsm_prob=0., ss_prob=0., ss_type='constant',
+            ctc_weight=0., ctc_lsm_prob=0., ctc_fc_list=None,
+            mbr_training=False, mbr_ce_weight=0.,
+            external_lm=None, lm_fusion='', lm_init=False,
+            backward=False, global_weight=1., mtl_per_batch=False, param_init=0.3,
+            mocha_chunk_size=1, mocha_n_heads_mono=1, mocha_init_r=-4, mocha_eps=1e-6,
+            mocha_std=1., mocha_1dconv=False, mocha_quantity_loss_weight=0.,
+            mocha_ctc_sync='', mocha_minlt_loss_weight=0.)
+        # the padding row stays zero when trained from zero initialization
+        self.dec_fwd.embed.weight.data[PAD] = 0
+
+
+@pytest.mark.parametrize("tie_embedding", [True, False])
+def test_quantize_decoder_layers(tie_embedding):
+    model = ASR(tie_embedding).eval()
+    model_q = quantize_decoder_layers(copy.deepcopy(model))
+    dec, dec_q = model.dec_fwd, model_q.dec_fwd
+
+    for name in ['embed', 'output', 'output_bn']:
+        assert type(getattr(dec_q, name)) is not type(getattr(dec, name)), name
+    # the float model is not affected
+    if tie_embedding:
+        assert dec.output.weight is dec.embed.weight
+
+    ys = torch.LongTensor([[4, 5, PAD, 2, PAD]])
+    emb, emb_q = dec.embed(ys), dec_q.embed(ys)
+    assert torch.allclose(emb, emb_q, atol=1e-2)
+    assert (emb_q[:, [2, 4]] == 0).all()
+
+    torch.manual_seed(1)
+    x = torch.randn(4, 16)
+    assert torch.allclose(dec.output(x), dec_q.output(x), atol=5e-2)
+
+    eouts = torch.randn(2, 9, 16)
+    elens = torch.IntTensor([9, 7])
+    ys = [[4, 5, 6], [7, 8]]
+    with torch.no_grad():
+        loss = dec.forward_att(eouts, elens, ys)[0]
+        loss_q = dec_q.forward_att(eouts, elens, ys)[0]
+    assert torch.isfinite(loss_q)
+    assert abs(loss.item() - loss_q.item()) < 5e-2 * abs(loss.item())
@@ -0,0 +1,35 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for utilities of beam search decoding."""
+
+import numpy as np
+import pytest
+
+from neural_sp.models.seq2seq.decoders.beam_search import BeamSearch
+
+EOS = 2
+
+
+@pytest.mark.parametrize("beam_width", [1, 3, 5])
+def test_backtrack(beam_width):
+    """Compare the trie with prefixes copied for every hypothesis."""
+    rng = np.random.RandomState(0)
+    helper = BeamSearch(beam_width, EOS, ctc_weight=0., device_id=-1)
+    ymax = 12
+    transcripts = np.zeros((beam_width, ymax), dtype=np.int64)
+    transcript_ptrs = np.zeros((beam_width, ymax), dtype=np.int64)
+
+    # each hypothesis: (the last token, row of the parent at the previous step, prefix, rows)
+    hyps = [(EOS, 0, [], [])]
+    for t in range(ymax):
+        transcripts[:len(hyps), t] = [token for token, _, _, _ in hyps]
+        transcript_ptrs[:len(hyps), t] = [row for _, row, _, _ in hyps]
+        hyps = [(token, row, prefix + [token], rows + [j]) for j, (token, row, prefix, rows) in enumerate(hyps)]
+        for j, (_, _, prefix, rows) in enumerate(hyps):
+            assert helper.backtrack(transcripts, transcript_ptrs, t, j) == (prefix, rows)
+
+        # expand and prune randomly; parents may have several or no children
+        n_hyps = min(beam_width, len(hyps) * beam_width)
+        parents = rng.randint(0, len(hyps), size=n_hyps)
+        hyps = [(int(rng.randint(3, 10)), int(j), hyps[j][2], hyps[j][3]) for j in parents]
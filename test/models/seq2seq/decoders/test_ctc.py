@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for CTC greedy decoding and trigger points."""
+
+from itertools import groupby
+import pytest
+import torch
+
+from neural_sp.models.seq2seq.decoders.ctc import CTC
+
+pytest.importorskip('warpctc_pytorch')
+
+BLANK = 0
+VOCAB = 6
+
+# NOTE: padded frames emit labels to check that they are excluded
+BEST_PATHS = [[1, 1, 0, 2, 2, 2, 0, 0, 1, 0, 0, 0],
+              [0, 3, 3, 0, 3, 4, 4, 0, 0, 5, 5, 5],
+              [4, 0, 5, 1, 2, 2, 3, 3, 1, 1, 4, 4]]
+ELENS = [12, 9, 4]
+
+
+def make_ctc():
+    ctc = CTC(eos=2, blank=BLANK, enc_n_units=VOCAB, vocab=VOCAB)
+    # pass encoder outputs through as logits
+    ctc.output.weight.data.copy_(torch.eye(VOCAB))
+    ctc.output.bias.data.zero_()
+    return ctc
+
+
+def make_inputs(bs):
+    """Make encoder outputs whose logits peak at `BEST_PATHS`."""
+    torch.manual_seed(1)
+    eouts = torch.rand(bs, len(BEST_PATHS[0]), VOCAB)
+    eouts.scatter_(2, torch.LongTensor(BEST_PATHS[:bs]).unsqueeze(2), 10.)
+    return eouts, torch.IntTensor(ELENS[:bs])
+
+
+def best_paths_ref(ctc, eouts):
+    return torch.log_softmax(ctc.output(eouts), dim=-1).argmax(-1)
+
+
+def greedy_ref(ctc, eouts, elens):
+    """Reference with the per-frame loop."""
+    best_paths = best_paths_ref(ctc, eouts)
+    hyps = []
+    for b in range(eouts.size(0)):
+        indices = [best_paths[b, t].item() for t in range(elens[b])]
+        collapsed_indices = [x[0] for x in groupby(indices)]
+        hyps.append([x for x in collapsed_indices if x != BLANK])
+    return hyps
+
+
+def trigger_points_ref(ctc, eouts, elens):
+    """Reference with the per-frame loop."""
+    best_paths = best_paths_ref(ctc, eouts)
+    hyps = greedy_ref(ctc, eouts, elens)
+    ymax = max([len(h) for h in hyps])
+    trigger_points = torch.zeros((eouts.size(0), ymax + 1), dtype=torch.int32)
+    for b in range(eouts.size(0)):
+        n_triggers = 0
+        for t in range(elens[b]):
+            token_idx = best_paths[b, t]
+            if token_idx == BLANK:
+                continue
+            if not (t == 0 or token_idx != best_paths[b, t - 1]):
+                continue
+            trigger_points[b, n_triggers] = t
+            n_triggers += 1
+    return trigger_points
+
+
+@pytest.mark.parametrize("bs", [1, 3])
+def test_greedy(bs):
+    ctc = make_ctc()
+    eouts, elens = make_inputs(bs)
+    with torch.no_grad():
+        hyps = ctc.greedy(eouts, elens)
+        hyps_ref = greedy_ref(ctc, eouts, elens)
+    assert best_paths_ref(ctc, eouts).tolist() == BEST_PATHS[:bs]
+    assert [list(h) for h in hyps] == hyps_ref
+
+
+@pytest.mark.parametrize("bs", [1, 3])
+def test_trigger_points(bs):
+    ctc = make_ctc()
+    eouts, elens = make_inputs(bs)
+    with torch.no_grad():
+        trigger_points = ctc.trigger_points(eouts, elens)
+        trigger_points_ref_ = trigger_points_ref(ctc, eouts, elens)
+    assert torch.equal(trigger_points.int(), trigger_points_ref_)
@@ -0,0 +1,224 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for the attention-based RNN decoder."""
+
+import math
+import pytest
+import torch
+
+from neural_sp.models.seq2seq.decoders.las import RNNDecoder
+
+ENC_N_UNITS = 16
+VOCAB = 12
+EOS = 2
+
+
+def make_decoder(attn_type='location', n_projs=0, tie_embedding=False, bottleneck_dim=16):
+    torch.manual_seed(0)
+    dec = RNNDecoder(
+        special_symbols={'eos': EOS, 'unk': 1, 'pad': 3, 'blank': 0},
+        enc_n_units=ENC_N_UNITS, attn_type=attn_type, rnn_type='lstm', n_units=16, n_projs=n_projs,
+        n_layers=2, bottleneck_dim=bottleneck_dim, emb_dim=bottleneck_dim, vocab=VOCAB,
+        tie_embedding=tie_embedding,
+        attn_dim=16, attn_sharpening_factor=1., attn_sigmoid_smoothing=False,
+        attn_conv_out_channels=4, attn_conv_kernel_size=5, attn_n_heads=1,
+        dropout=0., dropout_emb=0., dropout_att=0.,
+        lsm_prob=0., ss_prob=0., ss_type='constant',
+        ctc_weight=0., ctc_lsm_prob=0., ctc_fc_list=None,
+        mbr_training=False, mbr_ce_weight=0.,
+        external_lm=None, lm_fusion='', lm_init=False,
+        backward=False, global_weight=1., mtl_per_batch=False, param_init=0.3,
+        mocha_chunk_size=1, mocha_n_heads_mono=1, mocha_init_r=-4, mocha_eps=1e-6,
+        mocha_std=1., mocha_1dconv=False, mocha_quantity_loss_weight=0.,
+        mocha_ctc_sync='', mocha_minlt_loss_weight=0.)
+    return dec
+
+
+def test_generate_inplace_tanh():
+    dec = make_decoder()
+    torch.manual_seed(1)
+    cv = torch.randn(3, 1, ENC_N_UNITS, requires_grad=True)
+    dout = torch.randn(3, 1, 16, requires_grad=True)
+
+    out = dec.generate(cv, dout, None)
+    out.pow(2).sum().backward()
+    grads = [cv.grad.clone(), dout.grad.clone(), dec.output_bn.weight.grad.clone()]
+
+    cv.grad, dout.grad = None, None
+    dec.zero_grad()
+    out_ref = torch.tanh(dec.output_bn(torch.cat([dout, cv], dim=-1)))
+    out_ref.pow(2).sum().backward()
+    grads_ref = [cv.grad, dout.grad, dec.output_bn.weight.grad]
+
+    assert torch.allclose(out, out_ref, atol=1e-6)
+    for g, g_ref in zip(grads, grads_ref):
+        assert torch.allclose(g, g_ref, atol=1e-6)
+
+
+def test_recurrency_inplace_tanh():
+    dec = make_decoder(n_projs=8)
+    torch.manual_seed(1)
+    inputs = torch.randn(3, 1, 16 + ENC_N_UNITS, requires_grad=True)
+    dstate = dec.zero_state(3)['dstate']
+
+    dout = dec.recurrency(inputs, dstate)['dout_gen']
+    dout.pow(2).sum().backward()
+    grad = inputs.grad.clone()
+
+    # reference with out-of-place tanh
+    inputs.grad = None
+    hxs, cxs = dstate
+    h_in = inputs.squeeze(1)
+    for l in range(dec.n_layers):
+        h, _ = dec.rnn[l](h_in, (hxs[l], cxs[l]))
+        h_in = torch.tanh(dec.proj[l](h))
+    h_in.pow(2).sum().backward()
+
+    assert torch.allclose(dout.squeeze(1), h_in, atol=1e-6)
+    assert torch.allclose(grad, inputs.grad, atol=1e-6)
+
+
+@pytest.mark.parametrize("attn_type", ['location', 'luong_concat'])
+def test_forward_att_backward(attn_type):
+    dec = make_decoder(attn_type, n_projs=8)
+    torch.manual_seed(1)
+    eouts = torch.randn(3, 9, ENC_N_UNITS, requires_grad=True)
+    elens = torch.IntTensor([9, 7, 5])
+    loss = dec.forward_att(eouts, elens, [[4, 5, 6], [7, 8], [9, 10, 11, 4]])[0]
+    loss.backward()
+    assert torch.isfinite(eouts.grad).all()
+
+
+BEAM_PARAMS = {'recog_beam_width': 3, 'recog_ctc_weight': 0., 'recog_max_len_ratio': 1.,
+               'recog_min_len_ratio': 0., 'recog_length_penalty': 0., 'recog_coverage_penalty': 0.,
+               'recog_coverage_threshold': 0., 'recog_length_norm': False, 'recog_lm_weight': 0.,
+               'recog_lm_second_weight': 0., 'recog_lm_bwd_weight': 0., 'recog_gnmt_decoding': False,
+               'recog_eos_threshold': 1., 'recog_asr_state_carry_over': False,
+               'recog_lm_state_carry_over': False, 'recog_softmax_smoothing': 1.}
+
+
+@pytest.mark.parametrize("attn_type", ['location', 'add', 'luong_concat'])
+@pytest.mark.parametrize("ctc_weight", [0., 0.3])
+def test_beam_search_batch(attn_type, ctc_weight):
+    dec = make_decoder(attn_type)
+    dec.eval()
+    torch.manual_seed(1)
+    eouts = torch.randn(3, 9, ENC_N_UNITS)
+    elens = torch.IntTensor([9, 7, 5])
+    ctc_log_probs = torch.log_softmax(torch.randn(3, 9, VOCAB) * 2, dim=-1) if ctc_weight > 0 else None
+    params = dict(BEAM_PARAMS)
+    params['recog_ctc_weight'] = ctc_weight
+    params['recog_coverage_penalty'] = 0.1
+
+    hyps, aws, scores = dec.beam_search(eouts, elens, params, ctc_log_probs=ctc_log_probs,
+                                        nbest=2, return_aws=True)
+    # the key is projected once per utterance, not per hypothesis
+    assert dec.score.key.size(0) == 3
+    # reference: decode utterances one by one
+    for b in range(3):
+        hyps_b, aws_b, scores_b = dec.beam_search(
+            eouts[b:b + 1, :elens[b]], elens[b:b + 1], params,
+            ctc_log_probs=ctc_log_probs[b:b + 1, :elens[b]] if ctc_log_probs is not None else None,
+            nbest=2, return_aws=True)
+        assert [h.tolist() for h in hyps[b]] == [h.tolist() for h in hyps_b[0]]
+        assert scores[b] == pytest.approx(scores_b[0], abs=1e-5)
+        assert aws[b].shape == aws_b[0].shape
+        assert abs(aws[b] - aws_b[0]).max() < 1e-5
+
+
+def test_beam_search_first_step():
+    dec = make_decoder()
+    dec.eval()
+    n_rows = []
+    recurrency = dec.recurrency
+
+    def _recurrency(inputs, dstate):
+        n_rows.append(inputs.size(0))
+        return recurrency(inputs, dstate)
+
+    dec.recurrency = _recurrency
+    torch.manual_seed(1)
+    eouts = torch.randn(3, 9, ENC_N_UNITS)
+    elens = torch.IntTensor([9, 7, 5])
+    dec.beam_search(eouts, elens, dict(BEAM_PARAMS), nbest=1)
+    # the first step from <sos> is computed once per utterance
+    assert n_rows[0] == 3
+    assert set(n_rows[1:]) == {3 * BEAM_PARAMS['recog_beam_width']}
+
+
+# transition probabilities of a bigram model (<sos> is <eos>)
+BIGRAM = {EOS: {4: 0.5, EOS: 0.3, 5: 0.2},
+          4: {EOS: 0.95, 6: 0.05},
+          5: {6: 0.9, EOS: 0.1},
+          6: {7: 0.9, EOS: 0.1}}
+
+
+def make_bigram_decoder():
+    """Make a decoder whose scores depend only on the previous token."""
+    dec = make_decoder()
+    dec.eval()
+    # the other tokens are followed by <eos>
+    log_probs = torch.full((VOCAB, VOCAB), -20.)
+    log_probs[:, EOS] = 0.
+    for prev, probs in BIGRAM.items():
+        log_probs[prev].fill_(-20.)
+        for token, prob in probs.items():
+            log_probs[prev, token] = math.log(prob)
+    dec.embed.weight.data.zero_()
+    dec.embed.weight.data[:, :VOCAB] = torch.eye(VOCAB)
+    dec.output.weight.data.zero_()
+    dec.output.weight.data[:, :VOCAB] = log_probs.t()
+    dec.output.bias.data.zero_()
+
+    n_steps = []
+    decode_step = dec.decode_step
+
+    def _decode_step(eouts, dstates, cv, y_emb, *args, **kwargs):
+        n_steps.append(1)
+        dstates, cv, aw, _, beta = decode_step(eouts, dstates, cv, y_emb, *args, **kwargs)
+        return dstates, cv, aw, y_emb, beta
+
+    dec.decode_step = _decode_step
+    return dec, n_steps
+
+
+def test_beam_search_early_stop():
+    dec, n_steps = make_bigram_decoder()
+    torch.manual_seed(1)
+    eouts = torch.randn(2, 9, ENC_N_UNITS)
+    elens = torch.IntTensor([9, 7])
+    params = dict(BEAM_PARAMS)
+    params['recog_beam_width'] = 3
+    params['recog_eos_threshold'] = 2.  # allow <eos> after <sos>
+
+    # reference: N == beam width never stops before beam width hypotheses finish
+    hyps_ref, _, scores_ref = dec.beam_search(eouts, elens, params, nbest=3)
+    n_steps_ref = len(n_steps)
+    for nbest in [1, 2]:
+        del n_steps[:]
+        hyps, _, scores = dec.beam_search(eouts, elens, params, nbest=nbest)
+        for b in range(2):
+            assert [h.tolist() for h in hyps[b]] == [h.tolist() for h in hyps_ref[b][:nbest]]
+            assert scores[b] == pytest.approx(scores_ref[b][:nbest])
+        assert len(n_steps) < n_steps_ref
+    # <eos> at the first step is finished first, but it is not the best
+    assert [h.tolist() for h in hyps_ref[0][:2]] == [[4, EOS], [EOS]]
+
+
+def test_beam_search_no_valid_candidate():
+    dec = make_decoder()
+    dec.eval()
+    # <eos> is always the best token, but hypotheses are too short to finish
+    dec.output.bias.data[EOS] += 100
+    torch.manual_seed(1)
+    eouts = torch.randn(2, 9, ENC_N_UNITS)
+    elens = torch.IntTensor([9, 7])
+    params = dict(BEAM_PARAMS)
+    params['recog_beam_width'] = 1
+    params['recog_min_len_ratio'] = 0.5
+
+    # fall back to the active hypotheses
+    hyps, _, scores = dec.beam_search(eouts, elens, params, nbest=1)
+    assert [[h.tolist() for h in hyps_b] for hyps_b in hyps] == [[[]], [[]]]
+    assert scores == [[0.], [0.]]
@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for criterions."""
+
+import numpy as np
+import pytest
+import torch
+
+from neural_sp.models.criterion import cross_entropy_lsm
+
+
+def cross_entropy_lsm_ref(logits, ys, lsm_prob, ignore_index, normalize_length):
+    """Reference with the smoothed one-hot target distribution materialized."""
+    bs, _, vocab = logits.size()
+    ys = ys.view(-1)
+    logits = logits.view((-1, vocab))
+    mask = (ys == ignore_index)
+    target_dist = logits.new_zeros(logits.size()).fill_(lsm_prob / (vocab - 1))
+    target_dist.scatter_(1, ys.masked_fill(mask, 0).unsqueeze(1), 1 - lsm_prob)
+    log_probs = torch.log_softmax(logits, dim=-1)
+    loss_sum = -torch.mul(target_dist, log_probs).masked_fill(mask.unsqueeze(1), 0)
+    # KL(q || p) differs from the cross entropy only by the entropy of q, which is constant
+    kl_sum = torch.nn.functional.kl_div(log_probs, target_dist, reduction='none').masked_fill(mask.unsqueeze(1), 0)
+    n_tokens = len(ys) - mask.sum().item()
+    denom = n_tokens if normalize_length else bs
+    return loss_sum.sum() / denom, kl_sum.sum() / denom
+
+
+def make_batch(vocab, pad):
+    torch.manual_seed(0)
+    logits = torch.randn(3, 5, vocab) * 3
+    ys = torch.randint(0, vocab - 1, (3, 5))
+    ys[1, 3:] = pad
+    ys[2, 1:] = pad
+    return logits, ys
+
+
+@pytest.mark.parametrize("lsm_prob", [0.1, 0.3])
+@pytest.mark.parametrize("normalize_length", [True, False])
+def test_cross_entropy_lsm(lsm_prob, normalize_length):
+    vocab, pad = 11, 10
+    logits, ys = make_batch(vocab, pad)
+
+    logits_ref = logits.clone().requires_grad_()
+    loss_ref, kl_ref = cross_entropy_lsm_ref(logits_ref, ys, lsm_prob, pad, normalize_length)
+    grad_ref, = torch.autograd.grad(kl_ref, logits_ref)
+
+    logits = logits.clone().requires_grad_()
+    loss, ppl = cross_entropy_lsm(logits, ys, lsm_prob, pad, training=True,
+                                  normalize_length=normalize_length)
+    loss.backward()
+
+    assert torch.allclose(loss, loss_ref, atol=1e-5)
+    assert torch.allclose(logits.grad, grad_ref, atol=1e-6)
+    assert logits.grad[2, 1:].abs().sum() == 0  # padded positions
+
+    n_tokens = (ys != pad).sum().item()
+    loss_per_token = loss_ref.item() if normalize_length else loss_ref.item() * ys.size(0) / n_tokens
+    assert np.isclose(ppl, np.exp(loss_per_token), rtol=1e-5)